@@ -0,0 +1,224 @@
+"""
+app/evaluation/benchmark.py
+Offline retrieval benchmark.
+
+Builds the fixture corpus into an ephemeral (in-memory) VectorStore and
+measures, separately:
+- chunking latency per document
+- embedding latency per batch (embedding cache disabled)
+- index search latency per query (query embeddings precomputed)
+and retrieval quality (recall@k, MRR, nDCG@k). Results are emitted as JSON
+and can be compared against a previous run:
+
+    python -m app.evaluation.benchmark --output bench.json
+    python -m app.evaluation.benchmark --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app.evaluation.metrics import ranking_metrics
+from app.services.embedding_backends import BACKENDS, EMBEDDING_BACKEND
+from app.services.embedding_cache import EmbeddingCache
+from app.services.vector_store import DEFAULT_EMBEDDING_MODEL, VECTOR_INDEX_BACKEND, VectorStore
+from app.util.chunker import get_tokenizer, smart_chunker
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "benchmark_corpus.json")
+
+
+def latency_summary(durations: List[float], items_per_call: int = 1) -> Dict[str, float]:
+    """p50/p95/p99 latency in milliseconds and throughput in items/sec."""
+    ms = np.asarray(durations) * 1000.0
+    total = float(np.sum(durations))
+    return {
+        "calls": len(durations),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_sec": round(len(durations) * items_per_call / total, 2) if total else 0.0,
+    }
+
+
+def _time_calls(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_benchmark(
+    corpus_path: str = DEFAULT_CORPUS,
+    top_k: int = 5,
+    repeat: int = 20,
+    embed_batch_size: int = 32,
+    embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_backend: str = EMBEDDING_BACKEND,
+    index_backend: str = VECTOR_INDEX_BACKEND,
+) -> Dict[str, Any]:
+    with open(corpus_path) as f:
+        corpus = json.load(f)
+
+    clause_ids, clause_texts, clause_metas = [], [], []
+    for doc in corpus["documents"]:
+        for i, clause in enumerate(doc["clauses"]):
+            clause_ids.append(clause["clause_id"])
+            clause_texts.append(clause["text"])
+            clause_metas.append({"doc_id": doc["doc_id"], "chunk_index": i, "clause_id": clause["clause_id"]})
+    questions = [q["query"] for q in corpus["queries"]]
+    relevant = [q["relevant_clause_ids"] for q in corpus["queries"]]
+
+    vs = VectorStore(
+        collection_name=f"benchmark_{uuid.uuid4().hex[:8]}",
+        persist_directory=None,
+        embedding_model_name=embedding_model_name,
+        embedding_backend=embedding_backend,
+        index_backend=index_backend,
+    )
+    # measure the encoder, not the cache
+    vs.embedding_cache = EmbeddingCache(max_entries=0, disk_directory=None)
+
+    # CHUNKING
+    tokenizer = get_tokenizer()
+    doc_texts = [" ".join(c["text"] for c in doc["clauses"]) for doc in corpus["documents"]]
+    chunk_durations = []
+    for _ in range(repeat):
+        for text in doc_texts:
+            start = time.perf_counter()
+            smart_chunker(text, tokenizer=tokenizer, max_tokens=256, overlap=20)
+            chunk_durations.append(time.perf_counter() - start)
+
+    # EMBEDDING
+    vs.embed_texts(clause_texts[:2])  # model load is not part of the measurement
+    # distinct texts: the cache dedupes repeats within a call even when empty
+    batch = [f"{clause_texts[i % len(clause_texts)]} [{i}]" for i in range(embed_batch_size)]
+    embed_batch_durations = _time_calls(lambda: vs.embed_texts(batch, batch_size=embed_batch_size), repeat)
+    embed_single_durations = _time_calls(lambda: vs.embed_texts(questions[:1]), repeat)
+
+    # INDEX + SEARCH
+    vs.add_documents(clause_ids, clause_texts, clause_metas)
+    query_embeddings = vs.embed_texts(questions)
+    search_durations = []
+    retrieved_ids: List[List[str]] = []
+    for _ in range(repeat):
+        retrieved_ids = []
+        for embedding in query_embeddings:
+            start = time.perf_counter()
+            results = vs.collection.query(
+                query_embeddings=[embedding], n_results=top_k, include=["metadatas"]
+            )
+            search_durations.append(time.perf_counter() - start)
+            retrieved_ids.append(results["ids"][0])
+
+    return {
+        "config": {
+            "corpus": os.path.basename(corpus_path),
+            "documents": len(corpus["documents"]),
+            "clauses": len(clause_ids),
+            "queries": len(questions),
+            "top_k": top_k,
+            "repeat": repeat,
+            "embed_batch_size": embed_batch_size,
+            "embedding_model": embedding_model_name,
+            "embedding_backend": embedding_backend,
+            "index_backend": index_backend,
+        },
+        "chunking": latency_summary(chunk_durations),
+        "embedding": {
+            "batch": latency_summary(embed_batch_durations, items_per_call=len(batch)),
+            "single": latency_summary(embed_single_durations),
+        },
+        "search": latency_summary(search_durations),
+        "retrieval": ranking_metrics(retrieved_ids, relevant, k=top_k),
+    }
+
+
+def compare_to_baseline(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    max_regression: float,
+) -> Dict[str, Any]:
+    """
+    Relative p95 latency change per stage and absolute change per retrieval
+    metric. A stage regresses when p95 grows by more than max_regression;
+    a metric regresses when it drops at all.
+    """
+    stages = {
+        "chunking": lambda r: r["chunking"],
+        "embedding.batch": lambda r: r["embedding"]["batch"],
+        "embedding.single": lambda r: r["embedding"]["single"],
+        "search": lambda r: r["search"],
+    }
+    latency, regressions = {}, []
+    for name, get in stages.items():
+        try:
+            before, after = get(baseline)["p95_ms"], get(current)["p95_ms"]
+        except KeyError:
+            continue
+        change = (after - before) / before if before else 0.0
+        latency[name] = {"baseline_p95_ms": before, "p95_ms": after, "change": round(change, 4)}
+        if change > max_regression:
+            regressions.append(f"{name} p95 +{change:.0%}")
+
+    quality = {}
+    for metric, after in current["retrieval"].items():
+        before = baseline.get("retrieval", {}).get(metric)
+        if before is None:
+            continue
+        quality[metric] = {"baseline": before, "value": after, "change": round(after - before, 4)}
+        if after < before:
+            regressions.append(f"{metric} {before} -> {after}")
+
+    return {"latency": latency, "retrieval": quality, "regressions": regressions}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--index-backend", default=VECTOR_INDEX_BACKEND, choices=["chroma", "numpy"])
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative p95 increase before failing (default 0.2)")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        corpus_path=args.corpus,
+        top_k=args.top_k,
+        repeat=args.repeat,
+        embed_batch_size=args.embed_batch_size,
+        embedding_backend=args.backend,
+        index_backend=args.index_backend,
+    )
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["comparison"] = compare_to_baseline(result, json.load(f), args.max_regression)
+        exit_code = 1 if result["comparison"]["regressions"] else 0
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
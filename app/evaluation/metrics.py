@@ -1,5 +1,7 @@
 from typing import List, Set, Dict
 
+import numpy as np
+
 
 def precision_recall_f1(
     retrieved_ids: List[str],
@@ -27,3 +29,44 @@ def precision_recall_f1(
         "f1": round(f1, 4)
     }
 
+
+
+def ranking_metrics(
+    retrieved_ids: List[List[str]],
+    relevant_ids: List[List[str]],
+    k: int = 5
+) -> Dict[str, float]:
+    """
+    recall@k, MRR and nDCG@k over a batch of queries, computed on a
+    (queries x k) hit matrix with binary relevance.
+    """
+    n_queries = len(retrieved_ids)
+    if n_queries == 0:
+        return {f"recall@{k}": 0.0, "mrr": 0.0, f"ndcg@{k}": 0.0}
+
+    hits = np.zeros((n_queries, k), dtype=bool)
+    n_relevant = np.zeros(n_queries, dtype=np.float64)
+    for q, (retrieved, relevant) in enumerate(zip(retrieved_ids, relevant_ids)):
+        relevant_set = set(relevant)
+        n_relevant[q] = len(relevant_set)
+        top = retrieved[:k]
+        hits[q, : len(top)] = [r in relevant_set for r in top]
+
+    found = hits.sum(axis=1)
+    recall = np.divide(found, n_relevant, out=np.zeros(n_queries), where=n_relevant > 0)
+
+    any_hit = hits.any(axis=1)
+    first_rank = hits.argmax(axis=1) + 1
+    mrr = np.where(any_hit, 1.0 / first_rank, 0.0)
+
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    ideal_cum = np.concatenate([[0.0], np.cumsum(discounts)])
+    idcg = ideal_cum[np.minimum(n_relevant, k).astype(int)]
+    ndcg = np.divide(dcg, idcg, out=np.zeros(n_queries), where=idcg > 0)
+
+    return {
+        f"recall@{k}": round(float(recall.mean()), 4),
+        "mrr": round(float(mrr.mean()), 4),
+        f"ndcg@{k}": round(float(ndcg.mean()), 4),
+    }
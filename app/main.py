@@ -1,9 +1,27 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.routers.query import router as query_router
 from app.routers.upload import router as upload_router
 from app.routers.ask import router as ask_router
 from app.routers.evaluate import router as evaluate_router
+from app.routers.summary import router as summary_router
+from app.routers.bulk_ingest import router as bulk_ingest_router
+from app.routers.documents import router as documents_router
+from app.services.stage_executor import shutdown_stages, stage_stats
+from app.services.llm_client import close_llm_client
+from app.services.startup import get_startup_manager
+from app.services.extract_text import shutdown_pdf_pool
+from app.util.uploads import MaxBodySizeMiddleware
+from app.util.instrumentation import (
+    HTTP_REQUEST_SECONDS,
+    SERVER_TIMING,
+    end_request_timings,
+    render_metrics,
+    server_timing_header,
+    start_request_timings,
+)
 
 # CREATE THE FASTAPI APP
 app = FastAPI(
@@ -11,6 +29,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# UPLOAD SIZE LIMIT: 413 once a request body passes MAX_UPLOAD_BYTES
+app.add_middleware(MaxBodySizeMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -20,14 +41,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# INSTRUMENTATION: request latency per route, optional Server-Timing breakdown
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    token = start_request_timings()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        timings = end_request_timings(token)
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
 # REGISTER ROUTES
 app.include_router(upload_router, prefix="/api")
 app.include_router(query_router, prefix="/api")
 app.include_router(ask_router, prefix="/api")
-app.inlcude_router(evaluate_router, prefix="/api")
+app.include_router(evaluate_router, prefix="/api")
+app.include_router(summary_router, prefix="/api")
+app.include_router(bulk_ingest_router, prefix="/api")
+app.include_router(documents_router, prefix="/api")
+
+# STARTUP: models load lazily; optionally warm them up in the background
+@app.on_event("startup")
+def startup():
+    get_startup_manager().start()
+
+# SHUTDOWN: stop the stage and PDF worker pools and close pooled LLM connections
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_stages()
+    shutdown_pdf_pool()
+    await close_llm_client()
 
 # ROOT ROUTE
 @app.get("/")
 def home():
     return {"message": "Legal Doc Summarizer Running"}
 
+# READINESS: 503 until background warmup has loaded every heavy resource
+@app.get("/ready")
+def ready():
+    status = get_startup_manager().status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# STAGE QUEUE DEPTHS
+@app.get("/api/stages")
+def stages():
+    return stage_stats()
+
+# PROMETHEUS METRICS
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,22 +1,28 @@
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any, List
-from app.services.vector_store import VectorStore
-from app.services.summarizer import generate_summary
+from typing import Dict, Any, List, AsyncIterator, Optional
+from app.services.vector_store import get_vector_store
+from app.services.summarizer import query_ollama, stream_ollama
+from app.services.llm_client import LLMError
+from app.services.doc_registry import UnknownDocumentsError, get_doc_registry
+from app.util.chunker import get_tokenizer
+from app.util.context_packer import pack_context
 
 router = APIRouter()
 
-# Shared vector DB
-vs = VectorStore(
-    collection_name="legal_docs",
-    persist_directory="./chroma_db",
-    embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
-)
+
+NO_ANSWER = "The document does not contain this information."
 
 
 class AskRequest(BaseModel):
     question: str
     top_k: int = 3
+    # optional scope: only answer from these documents / chunks matching this metadata filter
+    doc_ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
 
 #BUILD RAG PROMPT
 def build_rag_prompt(question: str, context_chunks: List[str]) -> str:
@@ -56,28 +62,74 @@ FINAL ANSWER:
 
     return prompt.strip()
 
-#RAG ANSWER GENERATION ENDPOINT
-@router.post("/ask")
-def ask_question(req: AskRequest) -> Dict[str, Any]:
-    """Answer user questions using retrieved legal clauses + Gemma RAG."""
-
+def _retrieve(req: AskRequest) -> Dict[str, Any]:
+    """
+    Validates the question, retrieves chunks and packs them into prompt clauses
+    (near-duplicates dropped, neighbours merged, within the context token budget).
+    """
     if not req.question or len(req.question.strip()) < 3:
         raise HTTPException(status_code=400, detail="Invalid question")
 
-    # Step 1 — Retrieve relevant chunks from vector store
-    retrieved = vs.query(
-        query_text=req.question,
-        top_k=req.top_k,
-        include=["documents", "metadatas", "distances"]
-    )
+    try:
+        top_k = get_doc_registry().scoped_top_k(req.doc_ids, req.top_k)
+    except UnknownDocumentsError as e:
+        raise HTTPException(status_code=404, detail={"message": str(e), "unknown_doc_ids": e.missing})
+
+    vs = get_vector_store()
+    try:
+        retrieved = vs.query(
+            query_text=req.question,
+            top_k=top_k,
+            include=["documents", "metadatas", "distances", "embeddings"],
+            doc_ids=req.doc_ids,
+            where=req.where,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {e}")
 
     chunks = retrieved.get("documents") or []
+    metas = retrieved.get("metadatas") or []
+    dists = retrieved.get("distances") or []
+
+    packed = pack_context(
+        chunks,
+        metadatas=metas if len(metas) == len(chunks) else None,
+        embeddings=retrieved.get("embeddings"),
+        distances=dists,
+        tokenizer=get_tokenizer(),
+    )
+    dropped = set(packed["dropped"])
+
+    raw_chunk_info = []
+    for i in range(len(chunks)):
+        raw_chunk_info.append({
+            "clause_number": i + 1,
+            "chunk_text": chunks[i],
+            "metadata": metas[i] if i < len(metas) else {},
+            "distance": dists[i] if i < len(dists) else None,
+            "in_context": i not in dropped,
+        })
+
+    return {
+        "chunks": [p["text"] for p in packed["passages"]],
+        "raw_chunks": raw_chunk_info,
+        "context_tokens": packed["tokens"],
+    }
+
+#RAG ANSWER GENERATION ENDPOINT
+@router.post("/ask")
+async def ask_question(req: AskRequest) -> Dict[str, Any]:
+    """Answer user questions using retrieved legal clauses + Gemma RAG."""
+
+    # Step 1 — Retrieve relevant chunks from vector store (blocking → threadpool)
+    retrieved = await run_in_threadpool(_retrieve, req)
+    chunks = retrieved["chunks"]
 
     # If nothing relevant found → respond safely
     if not chunks:
         return {
             "status": "success",
-            "answer": "The document does not contain this information.",
+            "answer": NO_ANSWER,
             "used_clauses": [],
             "raw_chunks": []
         }
@@ -87,28 +139,66 @@ def ask_question(req: AskRequest) -> Dict[str, Any]:
 
     # Step 3 — Generate answer using Gemma
     try:
-        answer = generate_summary(rag_prompt)
-    except Exception:
-        answer = "The answer could not be generated due to an internal error."
+        answer = await query_ollama(rag_prompt)
+    except LLMError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={"message": "The answer could not be generated", "error": type(e).__name__, "reason": str(e)},
+        )
 
     # Step 4 — Return everything cleanly
-    raw_chunk_info = []
-    metas = retrieved.get("metadatas") or []
-    dists = retrieved.get("distances") or []
-
-    for i in range(len(chunks)):
-        raw_chunk_info.append({
-            "clause_number": i + 1,
-            "chunk_text": chunks[i],
-            "metadata": metas[i] if i < len(metas) else {},
-            "distance": dists[i] if i < len(dists) else None,
-        })
-
     return {
         "status": "success",
         "question": req.question,
         "answer": answer,
         "used_clauses": chunks,
-        "raw_chunks": raw_chunk_info,
+        "raw_chunks": retrieved["raw_chunks"],
+        "context_tokens": retrieved["context_tokens"],
     }
 
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+#STREAMING RAG ANSWER ENDPOINT (Server-Sent Events)
+@router.post("/ask/stream")
+async def ask_question_stream(req: AskRequest) -> StreamingResponse:
+    """
+    Same as /ask but streams the answer as Server-Sent Events:
+    - "clauses": retrieved clauses, sent before generation starts
+    - "token":   one event per generated token
+    - "done":    full answer once generation finishes
+    - "error":   generation failed part-way
+    """
+
+    retrieved = await run_in_threadpool(_retrieve, req)
+    chunks = retrieved["chunks"]
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("clauses", {
+            "question": req.question,
+            "used_clauses": chunks,
+            "raw_chunks": retrieved["raw_chunks"],
+        })
+
+        if not chunks:
+            yield _sse("done", {"answer": NO_ANSWER})
+            return
+
+        answer = []
+        try:
+            async for token in stream_ollama(build_rag_prompt(req.question, chunks)):
+                answer.append(token)
+                yield _sse("token", {"token": token})
+        except LLMError as e:
+            yield _sse("error", {"message": f"The answer could not be generated: {e}", "error": type(e).__name__})
+            return
+
+        yield _sse("done", {"answer": "".join(answer).strip()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,69 @@
+"""
+app/routers/bulk_ingest.py
+Start and monitor bulk corpus ingestion jobs (directory or zip on the server)
+"""
+
+import os
+import threading
+import uuid
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Dict, Any
+
+from app.services.bulk_ingest import BulkIngestJob
+from app.util.instrumentation import gauge
+
+router = APIRouter()
+
+# Only paths under this directory may be ingested through the API
+BULK_INGEST_ROOT = os.path.abspath(os.getenv("BULK_INGEST_ROOT", "./corpus"))
+
+_jobs: Dict[str, BulkIngestJob] = {}
+
+
+def _running_queue_depths() -> Dict[tuple, float]:
+    return {
+        (job_id, name): depth
+        for job_id, job in list(_jobs.items())
+        if job.status == "running"
+        for name, depth in job.stats()["queue_depths"].items()
+    }
+
+
+gauge(
+    "bulk_ingest_queue_depth", "Items waiting between bulk ingestion stages",
+    _running_queue_depths, ("job_id", "queue"),
+)
+
+
+class BulkIngestRequest(BaseModel):
+    path: str
+    summarize: bool = False
+    resume: bool = True
+
+
+@router.post("/ingest/bulk")
+def start_bulk_ingest(req: BulkIngestRequest) -> Dict[str, Any]:
+    path = os.path.abspath(os.path.join(BULK_INGEST_ROOT, req.path))
+    if os.path.commonpath([path, BULK_INGEST_ROOT]) != BULK_INGEST_ROOT:
+        raise HTTPException(status_code=400, detail=f"Path must be inside {BULK_INGEST_ROOT}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Path not found: {req.path}")
+    if any(job.status == "running" for job in _jobs.values()):
+        raise HTTPException(status_code=409, detail="A bulk ingest job is already running")
+
+    job_id = str(uuid.uuid4())
+    job = BulkIngestJob(path, summarize=req.summarize, resume=req.resume)
+    _jobs[job_id] = job
+    job.status = "running"
+    threading.Thread(target=job.run, name=f"bulk-ingest-{job_id}", daemon=True).start()
+
+    return {"status": "accepted", "job_id": job_id}
+
+
+@router.get("/ingest/bulk/{job_id}")
+def bulk_ingest_status(job_id: str) -> Dict[str, Any]:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job_id '{job_id}'")
+    return {"job_id": job_id, **job.stats()}
@@ -0,0 +1,29 @@
+"""
+app/routers/documents.py
+Registry of ingested documents (doc_id + chunk count), used to scope queries
+"""
+
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Any
+
+from app.services.doc_registry import get_doc_registry
+
+router = APIRouter()
+
+
+@router.get("/documents")
+def list_documents(limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+    registry = get_doc_registry()
+    return {
+        "status": "success",
+        "total": registry.count(),
+        "documents": registry.list_documents(limit=limit, offset=offset),
+    }
+
+
+@router.get("/documents/{doc_id:path}")
+def get_document(doc_id: str) -> Dict[str, Any]:
+    doc = get_doc_registry().get(doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Unknown doc_id '{doc_id}'")
+    return {"status": "success", **doc}
@@ -1,23 +1,18 @@
 from fastapi import APIRouter
 import json
 
-from app.services.vector_store import VectorStore
+from app.services.vector_store import get_vector_store
 from app.evaluation.metrics import precision_recall_f1
 
 router = APIRouter()
 
-vs = VectorStore(
-    collection_name="legal_docs",
-    persist_directory="./chroma_db",
-    embedding_model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-
 with open("app/evaluation/gold_data.json") as f:
     GOLD_DATA = json.load(f)
 
 
 @router.get("/evaluate")
 def evaluate_rag():
+    vs = get_vector_store()
     results = []
 
     for item in GOLD_DATA:
@@ -5,32 +5,36 @@ Query endpoint for retrieving the most relevant legal document chunks
 
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
-from app.services.vector_store import VectorStore
+from app.services.vector_store import get_vector_store
+from app.services.doc_registry import UnknownDocumentsError, get_doc_registry
 
 router = APIRouter()
 
-# shared vector store (same defaults as ingestion)
-vs = VectorStore(
-    collection_name="legal_docs",
-    persist_directory="./chroma_db",
-    embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
-)
+MAX_BATCH_QUESTIONS = 100
 
 
 class QueryRequest(BaseModel):
     question: str
     top_k: int = 5
+    # optional scope: only search these documents / chunks matching this metadata filter
+    doc_ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
 
 
-@router.post("/query")
-def query_document(req: QueryRequest) -> Dict[str, Any]:
-    if not req.question or len(req.question.strip()) < 3:
-        return {"status": "error", "message": "Invalid question"}
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: int = 5
+    doc_ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
+
 
-    results = vs.query(query_text=req.question, top_k=req.top_k, include=["documents", "metadatas", "distances"])
+def _valid_question(question: str) -> bool:
+    return bool(question) and len(question.strip()) >= 3
 
+
+def format_results(question: str, results: Dict[str, Any]) -> Dict[str, Any]:
     ids = results.get("ids") or []
     docs = results.get("documents") or []
     metas = results.get("metadatas") or []
@@ -38,7 +42,7 @@ def query_document(req: QueryRequest) -> Dict[str, Any]:
 
     # ensure nested-list normalization already done by vector_store; handle empty
     if not docs:
-        return {"status": "success", "query": req.question, "results": [], "message": "No relevant chunks found"}
+        return {"status": "success", "query": question, "results": [], "message": "No relevant chunks found"}
 
     formatted = []
     # length of docs should equal length of ids/metas/dists (best effort)
@@ -51,5 +55,70 @@ def query_document(req: QueryRequest) -> Dict[str, Any]:
             "distance_score": dists[i] if i < len(dists) else None
         })
 
-    return {"status": "success", "query": req.question, "results": formatted}
+    return {"status": "success", "query": question, "results": formatted}
+
+
+@router.post("/query")
+def query_document(req: QueryRequest) -> Dict[str, Any]:
+    if not _valid_question(req.question):
+        return {"status": "error", "message": "Invalid question"}
+
+    try:
+        top_k = get_doc_registry().scoped_top_k(req.doc_ids, req.top_k)
+    except UnknownDocumentsError as e:
+        return {"status": "error", "message": str(e), "unknown_doc_ids": e.missing}
+
+    # shared vector store (same defaults as ingestion)
+    vs = get_vector_store()
+    try:
+        results = vs.query(
+            query_text=req.question,
+            top_k=top_k,
+            include=["documents", "metadatas", "distances"],
+            doc_ids=req.doc_ids,
+            where=req.where,
+        )
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid filter: {e}"}
+
+    return format_results(req.question, results)
+
+
+@router.post("/query/batch")
+def query_documents_batch(req: BatchQueryRequest) -> Dict[str, Any]:
+    """
+    Runs many questions in one go: one embedding call and one Chroma query
+    for all of them. Each entry of "results" has the /query response format.
+    """
+    if not req.questions:
+        return {"status": "error", "message": "No questions given"}
+    if len(req.questions) > MAX_BATCH_QUESTIONS:
+        return {"status": "error", "message": f"At most {MAX_BATCH_QUESTIONS} questions per batch"}
+
+    try:
+        top_k = get_doc_registry().scoped_top_k(req.doc_ids, req.top_k)
+    except UnknownDocumentsError as e:
+        return {"status": "error", "message": str(e), "unknown_doc_ids": e.missing}
+
+    valid = [q for q in req.questions if _valid_question(q)]
+    vs = get_vector_store()
+    try:
+        batch = vs.query_many(
+            valid,
+            top_k=top_k,
+            include=["documents", "metadatas", "distances"],
+            doc_ids=req.doc_ids,
+            where=req.where,
+        ) if valid else []
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid filter: {e}"}
+    by_question = dict(zip(valid, batch))
+
+    responses = []
+    for question in req.questions:
+        if question in by_question:
+            responses.append(format_results(question, by_question[question]))
+        else:
+            responses.append({"status": "error", "query": question, "message": "Invalid question"})
 
+    return {"status": "success", "count": len(responses), "results": responses}
@@ -0,0 +1,19 @@
+"""
+app/routers/summary.py
+Fetch the cached summary of a previously uploaded document
+"""
+
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Any
+
+from app.services.summary_store import get_summary_store
+
+router = APIRouter()
+
+
+@router.get("/summary/{doc_id:path}")
+def get_summary(doc_id: str) -> Dict[str, Any]:
+    cached = get_summary_store().get_by_doc_id(doc_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail=f"No cached summary for doc_id '{doc_id}'")
+    return {"status": "success", **cached}
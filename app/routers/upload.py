@@ -3,31 +3,113 @@ app/routers/upload.py
 Upload endpoint: receives file, extracts text, ingests to vector DB, returns summary + details
 """
 
+import asyncio
+import logging
+import os
+import time
+import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import Dict, Any
-from app.services.extract_text import extract_text_from_file
+from typing import Any, Callable, Dict, Optional
+from app.services.extract_text import (
+    extract_text_from_path,
+    iter_spooled_pages,
+    needs_pdf_fanout,
+    spool_text_pages,
+)
 from app.services.summarizer import generate_summary
 from app.services.extract_details import extract_important_details
-from app.services.ingest_document import ingest_document
+from app.services.ingest_document import ingest_document, ingest_pages, clean_text
+from app.services.summary_store import get_summary_store, hash_text
+from app.services.stage_executor import StageSaturatedError, get_stage
+from app.services.llm_client import LLMError
+from app.util.instrumentation import EXTRACT_SECONDS
+from app.util.uploads import BodyTooLargeError, spool_to_disk
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 router = APIRouter()
 
+RETRY_AFTER_SECONDS = "5"
+
+
+def _saturated(e: StageSaturatedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=e.to_detail(),
+        headers={"Retry-After": RETRY_AFTER_SECONDS},
+    )
+
+
+async def run_extraction(stage, fn: Callable, path: str, filename: Optional[str]) -> Any:
+    """
+    Runs fn(path, filename) on the extract stage. Large PDFs run on a thread
+    of this process instead of a stage worker, so iter_pdf_pages can spread
+    their page ranges over the shared PDF pool.
+    """
+    if await asyncio.to_thread(needs_pdf_fanout, path, filename):
+        return await stage.run_in_thread(fn, path, filename)
+    return await stage.run(fn, path, filename)
+
 
 @router.post("/upload")
 async def upload_document(file: UploadFile = File(...)) -> Dict[str, Any]:
-    # 1. extract text
+    # Every blocking stage runs on its own bounded pool so the event loop stays free
+    extract_stage = get_stage("extract")
+    llm_stage = get_stage("llm")
+    embed_stage = get_stage("embed")
+
+    # fail fast before reading the body if extraction is already saturated
+    try:
+        extract_stage.check_capacity()
+    except StageSaturatedError as e:
+        raise _saturated(e)
+
+    # 1. extract text: the worker process opens a disk copy of the spooled
+    # upload, so the body is never held in memory or pickled
     try:
-        text = extract_text_from_file(file)
+        upload_path = await asyncio.to_thread(spool_to_disk, file.file, file.filename)
+    except BodyTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    file_type = os.path.splitext(file.filename or "")[1].lower().lstrip(".") or "unknown"
+    started = time.perf_counter()
+    try:
+        text = await run_extraction(extract_stage, extract_text_from_path, upload_path, file.filename)
+        EXTRACT_SECONDS.observe(time.perf_counter() - started, file_type=file_type)
+    except StageSaturatedError as e:
+        raise _saturated(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to extract text: {e}")
+    finally:
+        os.unlink(upload_path)
+        await file.close()
+
+    # doc_id from filename or uuid
+    doc_id = file.filename or str(uuid.uuid4())
 
-    # 2. generate summary
+    # 2. generate summary (or reuse the stored one for identical text).
+    # Don't fail ingest just because the summary step had an issue; report it
+    # instead. A summary that was generated is kept even if storing it fails.
+    summary = ""
+    summary_error = None
+    summary_cached = False
     try:
-        summary = generate_summary(text)
+        store = get_summary_store()
+        text_hash = await asyncio.to_thread(lambda: hash_text(clean_text(text)))
+        cached = await asyncio.to_thread(store.get, text_hash)
+        if cached is not None:
+            summary, summary_cached = cached, True
+            await asyncio.to_thread(store.link_document, doc_id, text_hash)
+        else:
+            summary = await llm_stage.run_async(generate_summary, text)
+            await asyncio.to_thread(store.put, text_hash, summary, doc_id)
+    except StageSaturatedError as e:
+        raise _saturated(e)
+    except LLMError as e:
+        summary_error = {"error": type(e).__name__, "reason": str(e)}
     except Exception as e:
-        # don't fail ingest just because summarizer had an issue; warn instead
-        summary = ""
-        # optional: log here
+        logger.exception(f"Summary step failed for {doc_id}")
+        summary_error = {"error": type(e).__name__, "reason": str(e)}
 
     # 3. extract details
     try:
@@ -35,9 +117,11 @@ async def upload_document(file: UploadFile = File(...)) -> Dict[str, Any]:
     except Exception:
         details = {}
 
-    # 4. ingest to vector DB (create doc_id from filename or uuid)
-    doc_id = file.filename or None
-    ingest_result = ingest_document(text=text, doc_id=doc_id)
+    # 4. ingest to vector DB
+    try:
+        ingest_result = await embed_stage.run(ingest_document, text=text, doc_id=doc_id)
+    except StageSaturatedError as e:
+        raise _saturated(e)
 
     if ingest_result.get("status") != "success":
         raise HTTPException(status_code=500, detail=f"Ingest failed: {ingest_result}")
@@ -47,6 +131,54 @@ async def upload_document(file: UploadFile = File(...)) -> Dict[str, Any]:
         "doc_id": ingest_result.get("doc_id"),
         "chunks_created": ingest_result.get("chunks_created"),
         "summary": summary,
+        "summary_cached": summary_cached,
+        "summary_error": summary_error,
         "details": details,
     }
 
+
+@router.post("/ingest")
+async def ingest_upload(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """
+    Indexes a document without summarizing it. The extract stage parses
+    (and OCRs) the spooled upload page by page into a pages file; the embed
+    stage then streams those pages through cleaning, chunking and batched
+    embedding, so memory stays flat however long the document is.
+    """
+    extract_stage = get_stage("extract")
+    embed_stage = get_stage("embed")
+    try:
+        extract_stage.check_capacity()
+        embed_stage.check_capacity()
+    except StageSaturatedError as e:
+        raise _saturated(e)
+
+    try:
+        upload_path = await asyncio.to_thread(spool_to_disk, file.file, file.filename)
+    except BodyTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    file_type = os.path.splitext(file.filename or "")[1].lower().lstrip(".") or "unknown"
+    started = time.perf_counter()
+    try:
+        pages_path = await run_extraction(extract_stage, spool_text_pages, upload_path, file.filename)
+        EXTRACT_SECONDS.observe(time.perf_counter() - started, file_type=file_type)
+    except StageSaturatedError as e:
+        raise _saturated(e)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to extract text: {e}")
+    finally:
+        os.unlink(upload_path)
+        await file.close()
+
+    try:
+        ingest_result = await embed_stage.run(
+            ingest_pages, iter_spooled_pages(pages_path), file.filename or str(uuid.uuid4())
+        )
+    except StageSaturatedError as e:
+        raise _saturated(e)
+    finally:
+        os.unlink(pages_path)
+
+    if ingest_result.get("status") != "success":
+        raise HTTPException(status_code=500, detail=f"Ingest failed: {ingest_result}")
+    return ingest_result
@@ -0,0 +1,449 @@
+"""
+app/services/bulk_ingest.py
+Bulk corpus ingestion: a directory tree or a zip archive of documents is
+pushed through concurrent pipeline stages connected by bounded queues:
+
+    source -> extract (process pool) -> chunk -> embed -> write
+                                           \\-> summarize (optional)
+
+Embeddings are computed in large cross-document batches and written to
+Chroma in large upserts. Finished documents are appended to a JSONL
+manifest, so re-running the same job skips them (resume after a crash).
+
+Summaries run on the job's own event loop, whose LLM client is capped at
+BULK_SUMMARY_PARALLEL calls. The LLM_MAX_PARALLEL limit is per event loop,
+so the model server sees up to LLM_MAX_PARALLEL + BULK_SUMMARY_PARALLEL
+calls while a job summarizes next to the API.
+
+CLI:
+    python -m app.services.bulk_ingest /data/judgments --summarize
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.services.extract_text import extract_text_from_path, extract_text_from_zip_member
+from app.services.ingest_document import (
+    TOKENIZER_NAME,
+    chunk_hash,
+    chunk_metadata,
+    clean_text,
+    make_chunk_id,
+)
+from app.services.vector_store import get_vector_store
+from app.services.doc_registry import get_doc_registry
+from app.services.stage_executor import mark_pool_worker
+from app.util.chunker import get_tokenizer, smart_chunker
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif")
+
+BULK_EXTRACT_WORKERS = int(os.getenv("BULK_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+BULK_QUEUE_SIZE = int(os.getenv("BULK_QUEUE_SIZE", "64"))
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "256"))
+BULK_WRITE_BATCH = int(os.getenv("BULK_WRITE_BATCH", "2000"))
+BULK_PROGRESS_SECONDS = float(os.getenv("BULK_PROGRESS_SECONDS", "10"))
+BULK_SUMMARY_PARALLEL = int(os.getenv("BULK_SUMMARY_PARALLEL", "1"))
+
+_DONE = object()
+
+
+def iter_sources(path: str) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+    """
+    Yields (doc_id, extract_args) for every supported file under path.
+    doc_id is the path relative to the directory, or the member name in a zip.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in sorted(archive.namelist()):
+                if member.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield member, ("zip", path, member)
+        return
+
+    if os.path.isfile(path):
+        yield os.path.basename(path), ("file", path)
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, path), ("file", full)
+
+
+def _extract_call(source: Tuple[str, ...]):
+    # extract_text functions are submitted directly so spawned workers only
+    # import the extraction module, not the tokenizer / vector store
+    if source[0] == "zip":
+        return extract_text_from_zip_member, source[1:]
+    return extract_text_from_path, source[1:]
+
+
+class BulkIngestJob:
+    def __init__(
+        self,
+        path: str,
+        manifest_path: Optional[str] = None,
+        summarize: bool = False,
+        resume: bool = True,
+        extract_workers: int = BULK_EXTRACT_WORKERS,
+        queue_size: int = BULK_QUEUE_SIZE,
+        embed_batch: int = BULK_EMBED_BATCH,
+        write_batch: int = BULK_WRITE_BATCH,
+    ):
+        self.path = path
+        self.manifest_path = manifest_path or os.path.abspath(path).rstrip(os.sep) + ".ingest-manifest.jsonl"
+        self.summarize = summarize
+        self.resume = resume
+        self.extract_workers = max(1, extract_workers)
+        self.embed_batch = embed_batch
+        self.write_batch = write_batch
+
+        self.vs = get_vector_store()
+        self.registry = get_doc_registry()
+        self._extracted: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._chunked: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._embedded: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._to_summarize: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._manifest_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.docs_skipped = 0
+        self.docs_done = 0
+        self.docs_failed = 0
+        self.chunks_written = 0
+        self.summaries_done = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    # MANIFEST
+
+    def _completed_doc_ids(self) -> Set[str]:
+        done: Set[str] = set()
+        if not (self.resume and os.path.exists(self.manifest_path)):
+            return done
+        with open(self.manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                if entry.get("status") == "done":
+                    done.add(entry["doc_id"])
+        return done
+
+    def _record(self, doc_id: str, status: str, **extra: Any) -> None:
+        entry = {"doc_id": doc_id, "status": status, "ts": time.time(), **extra}
+        with self._manifest_lock:
+            with open(self.manifest_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    # STAGES
+
+    def _put(self, q: "queue.Queue", item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue") -> Any:
+        # a crashed stage sets _stop; treat that as end of input downstream
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _source_and_extract(self) -> None:
+        completed = self._completed_doc_ids()
+        pool = ProcessPoolExecutor(
+            max_workers=self.extract_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=mark_pool_worker,
+        )
+        pending = deque()
+
+        def drain_one() -> None:
+            doc_id, future = pending.popleft()
+            try:
+                text = future.result()
+            except Exception as e:
+                self.docs_failed += 1
+                self._record(doc_id, "failed", stage="extract", error=str(e))
+                return
+            self._put(self._extracted, (doc_id, text))
+
+        try:
+            for doc_id, source in iter_sources(self.path):
+                if self._stop.is_set():
+                    break
+                if doc_id in completed:
+                    self.docs_skipped += 1
+                    continue
+                fn, args = _extract_call(source)
+                pending.append((doc_id, pool.submit(fn, *args)))
+                # bounded in-flight window; results are consumed in submission order
+                if len(pending) >= 2 * self.extract_workers:
+                    drain_one()
+            while pending and not self._stop.is_set():
+                drain_one()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._put(self._extracted, _DONE)
+
+    def _chunk(self) -> None:
+        while True:
+            item = self._get(self._extracted)
+            if item is _DONE:
+                break
+            doc_id, text = item
+            try:
+                cleaned = clean_text(text)
+                if not cleaned or len(cleaned) < 20:
+                    self.docs_failed += 1
+                    self._record(doc_id, "failed", stage="chunk", error="Document empty or too short")
+                    continue
+                chunks = smart_chunker(
+                    cleaned, tokenizer=get_tokenizer(TOKENIZER_NAME), max_tokens=256, overlap=20
+                )
+                if not chunks:
+                    self.docs_failed += 1
+                    self._record(doc_id, "failed", stage="chunk", error="No chunks produced")
+                    continue
+                taken: Set[str] = set()
+                ids, metas = [], []
+                for i, chunk in enumerate(chunks):
+                    h = chunk_hash(chunk)
+                    ids.append(make_chunk_id(doc_id, h, taken))
+                    metas.append(chunk_metadata(doc_id, i, h))
+                # chunks left over from an older version of this document
+                stored = self.vs.get_document_chunks(doc_id)["ids"]
+                stale = [id_ for id_ in stored if id_ not in taken]
+            except Exception as e:
+                self.docs_failed += 1
+                self._record(doc_id, "failed", stage="chunk", error=str(e))
+                continue
+
+            if not self._put(self._chunked, (doc_id, ids, chunks, metas, stale)):
+                break
+            if self.summarize:
+                self._put(self._to_summarize, (doc_id, cleaned))
+
+        self._put(self._chunked, _DONE)
+        if self.summarize:
+            self._put(self._to_summarize, _DONE)
+
+    def _embed(self) -> None:
+        # rows: (doc_id, id, text, metadata); docs: doc_id -> (chunk count, stale ids)
+        rows: List[Tuple[str, str, str, Dict[str, Any]]] = []
+        docs: Dict[str, Tuple[int, List[str]]] = {}
+
+        def flush() -> None:
+            if not rows:
+                return
+            embeddings = self.vs.embed_texts([r[2] for r in rows], batch_size=64)
+            self._put(self._embedded, (list(rows), embeddings, dict(docs)))
+            rows.clear()
+            docs.clear()
+
+        while True:
+            item = self._get(self._chunked)
+            if item is _DONE:
+                break
+            doc_id, ids, chunks, metas, stale = item
+            docs[doc_id] = (len(ids), stale)
+            rows.extend((doc_id, id_, chunk, meta) for id_, chunk, meta in zip(ids, chunks, metas))
+            if len(rows) >= self.embed_batch:
+                flush()
+        flush()
+        self._put(self._embedded, _DONE)
+
+    def _write(self) -> None:
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        embeddings: List[List[float]] = []
+        remaining: Dict[str, int] = {}
+        totals: Dict[str, int] = {}
+        stale_ids: Dict[str, List[str]] = {}
+        buffered_docs: Dict[str, int] = {}
+
+        def flush() -> None:
+            if ids:
+                self.vs.write_embeddings(ids, documents, metadatas, embeddings)
+                self.chunks_written += len(ids)
+            for doc_id, count in buffered_docs.items():
+                remaining[doc_id] -= count
+                if remaining[doc_id] == 0:
+                    del remaining[doc_id]
+                    total = totals.pop(doc_id)
+                    stale = stale_ids.pop(doc_id, [])
+                    if stale:
+                        self.vs.delete_by_id(stale)
+                    self.registry.upsert(doc_id, total)
+                    self.docs_done += 1
+                    self._record(doc_id, "done", chunks=total)
+            ids.clear()
+            documents.clear()
+            metadatas.clear()
+            embeddings.clear()
+            buffered_docs.clear()
+
+        while True:
+            item = self._get(self._embedded)
+            if item is _DONE:
+                break
+            rows, batch_embeddings, docs = item
+            for doc_id, (count, stale) in docs.items():
+                remaining[doc_id] = remaining.get(doc_id, 0) + count
+                totals[doc_id] = totals.get(doc_id, 0) + count
+                stale_ids[doc_id] = stale
+            for (doc_id, id_, chunk, meta), emb in zip(rows, batch_embeddings):
+                ids.append(id_)
+                documents.append(chunk)
+                metadatas.append(meta)
+                embeddings.append(emb)
+                buffered_docs[doc_id] = buffered_docs.get(doc_id, 0) + 1
+            if len(ids) >= self.write_batch:
+                flush()
+        flush()
+
+    def _summarize(self) -> None:
+        from app.services.llm_client import OllamaClient, close_llm_client, set_llm_client
+        from app.services.summarizer import generate_summary
+        from app.services.summary_store import get_summary_store, hash_text
+
+        async def bind_client() -> None:
+            set_llm_client(OllamaClient(max_parallel=BULK_SUMMARY_PARALLEL))
+
+        store = get_summary_store()
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(bind_client())
+        try:
+            while True:
+                item = self._get(self._to_summarize)
+                if item is _DONE:
+                    break
+                doc_id, cleaned = item
+                text_hash = hash_text(cleaned)
+                try:
+                    if store.get(text_hash) is not None:
+                        store.link_document(doc_id, text_hash)
+                    else:
+                        summary = loop.run_until_complete(generate_summary(cleaned))
+                        store.put(text_hash, summary, doc_id)
+                    self.summaries_done += 1
+                except Exception as e:
+                    logger.warning(f"Summary failed for {doc_id}: {e}")
+        finally:
+            loop.run_until_complete(close_llm_client())
+            loop.close()
+
+    # DRIVER
+
+    def _run_stage(self, fn) -> None:
+        try:
+            fn()
+        except Exception as e:
+            logger.exception(f"Bulk ingest stage {fn.__name__} crashed")
+            self.error = f"{fn.__name__}: {e}"
+            self._stop.set()
+
+    def run(self) -> Dict[str, Any]:
+        self.status = "running"
+        self.started_at = time.time()
+        stages = [self._source_and_extract, self._chunk, self._embed, self._write]
+        if self.summarize:
+            stages.append(self._summarize)
+        threads = [
+            threading.Thread(target=self._run_stage, args=(fn,), name=f"bulk{fn.__name__}", daemon=True)
+            for fn in stages
+        ]
+        for t in threads:
+            t.start()
+
+        last_report = time.time()
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=0.5)
+            if time.time() - last_report >= BULK_PROGRESS_SECONDS:
+                logger.info(f"Bulk ingest progress: {self.stats()}")
+                last_report = time.time()
+
+        self.finished_at = time.time()
+        self.status = "failed" if self.error else "finished"
+        result = self.stats()
+        logger.info(f"Bulk ingest {self.status}: {result}")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "status": self.status,
+            "error": self.error,
+            "path": self.path,
+            "manifest": self.manifest_path,
+            "docs_done": self.docs_done,
+            "docs_failed": self.docs_failed,
+            "docs_skipped": self.docs_skipped,
+            "chunks_written": self.chunks_written,
+            "summaries_done": self.summaries_done,
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_sec": round(self.docs_done / elapsed, 3) if elapsed else 0.0,
+            "chunks_per_sec": round(self.chunks_written / elapsed, 3) if elapsed else 0.0,
+            "queue_depths": {
+                "extracted": self._extracted.qsize(),
+                "chunked": self._chunked.qsize(),
+                "embedded": self._embedded.qsize(),
+                "to_summarize": self._to_summarize.qsize(),
+            },
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory or zip archive of legal documents")
+    parser.add_argument("path", help="directory or .zip archive")
+    parser.add_argument("--manifest", help="resume manifest (default: <path>.ingest-manifest.jsonl)")
+    parser.add_argument("--summarize", action="store_true", help="also generate and store summaries")
+    parser.add_argument("--no-resume", action="store_true", help="ignore documents already in the manifest")
+    parser.add_argument("--extract-workers", type=int, default=BULK_EXTRACT_WORKERS)
+    parser.add_argument("--embed-batch", type=int, default=BULK_EMBED_BATCH)
+    parser.add_argument("--write-batch", type=int, default=BULK_WRITE_BATCH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    job = BulkIngestJob(
+        args.path,
+        manifest_path=args.manifest,
+        summarize=args.summarize,
+        resume=not args.no_resume,
+        extract_workers=args.extract_workers,
+        embed_batch=args.embed_batch,
+        write_batch=args.write_batch,
+    )
+    print(json.dumps(job.run(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+app/services/doc_registry.py
+Lightweight registry of ingested documents (SQLite): doc_id -> chunk count.
+
+Lets scoped queries validate doc_ids and size top_k without scanning the
+Chroma collection. Kept up to date by ingest_document and bulk ingestion;
+`python -m app.services.doc_registry --rebuild` backfills it from an
+existing collection.
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DOC_REGISTRY_PATH = os.getenv("DOC_REGISTRY_PATH", "./doc_registry.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    chunk_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class UnknownDocumentsError(Exception):
+    def __init__(self, missing: List[str]):
+        self.missing = missing
+        super().__init__(f"Unknown doc_ids: {', '.join(missing)}")
+
+
+class DocRegistry:
+    def __init__(self, path: str = DOC_REGISTRY_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, doc_id: str, chunk_count: int) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO documents (doc_id, chunk_count, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET chunk_count = excluded.chunk_count, updated_at = excluded.updated_at",
+                (doc_id, chunk_count, now, now),
+            )
+
+    def remove(self, doc_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def get_many(self, doc_ids: List[str]) -> Dict[str, int]:
+        """Returns {doc_id: chunk_count} for the registered ids among doc_ids."""
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" for _ in doc_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT doc_id, chunk_count FROM documents WHERE doc_id IN ({placeholders})",
+                list(doc_ids),
+            ).fetchall()
+        return dict(rows)
+
+    def scoped_top_k(self, doc_ids: Optional[List[str]], top_k: int) -> int:
+        """
+        Validates a doc_id scope and clamps top_k to the chunks available in it.
+        Raises UnknownDocumentsError if any doc_id was never ingested.
+        """
+        if not doc_ids:
+            return top_k
+        counts = self.get_many(doc_ids)
+        missing = [d for d in dict.fromkeys(doc_ids) if d not in counts]
+        if missing:
+            raise UnknownDocumentsError(missing)
+        return max(1, min(top_k, sum(counts.values())))
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT doc_id, chunk_count, created_at, updated_at FROM documents WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("doc_id", "chunk_count", "created_at", "updated_at"), row))
+
+    def list_documents(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT doc_id, chunk_count, created_at, updated_at FROM documents "
+                "ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(zip(("doc_id", "chunk_count", "created_at", "updated_at"), r)) for r in rows]
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def rebuild(self, collection, page_size: int = 5000) -> int:
+        """Recounts chunks per doc_id from a Chroma collection's metadata."""
+        counts: Dict[str, int] = {}
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            metadatas = page.get("metadatas") or []
+            if not metadatas:
+                break
+            for meta in metadatas:
+                doc_id = (meta or {}).get("doc_id")
+                if doc_id:
+                    counts[doc_id] = counts.get(doc_id, 0) + 1
+            offset += len(metadatas)
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents")
+            conn.executemany(
+                "INSERT INTO documents (doc_id, chunk_count, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                [(doc_id, n, now, now) for doc_id, n in counts.items()],
+            )
+        logger.info(f"Doc registry rebuilt: {len(counts)} documents")
+        return len(counts)
+
+
+_registry: Optional[DocRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_doc_registry() -> DocRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DocRegistry()
+    return _registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or rebuild the document registry")
+    parser.add_argument("--rebuild", action="store_true", help="recount chunks from the Chroma collection")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    registry = get_doc_registry()
+    if args.rebuild:
+        from app.services.vector_store import get_vector_store
+        registry.rebuild(get_vector_store().collection)
+    print(f"{registry.count()} documents registered")
@@ -0,0 +1,186 @@
+"""
+app/services/embedding_backends.py
+Interchangeable CPU inference backends for the sentence embedding model.
+
+- torch       full-precision PyTorch SentenceTransformer (reference)
+- torch-int8  same model with Linear layers dynamically quantized to int8
+- onnx        ONNX Runtime export of the model (needs optimum[onnxruntime])
+- onnx-int8   ONNX Runtime with a dynamically int8-quantized graph
+
+Chosen with EMBEDDING_BACKEND. Non-reference backends produce slightly
+different vectors, so their cache_name (used for embedding cache keys) is
+distinct from the model name. Check agreement before switching an existing
+collection:
+
+    python -m app.services.embedding_backends --candidate onnx-int8
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Dict, List, Tuple, Type
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+REFERENCE_BACKEND = "torch"
+# Pre-quantized graph shipped in the model repo's onnx/ folder; pick the one matching the CPU
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+def embedding_cache_name(model_name: str, backend: str) -> str:
+    """Embedding cache namespace; the reference backend keeps the bare model name."""
+    if backend == REFERENCE_BACKEND:
+        return model_name
+    return f"{model_name}@{backend}"
+
+
+class EmbeddingBackend:
+    name = ""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = self._load()
+
+    @property
+    def cache_name(self) -> str:
+        return embedding_cache_name(self.model_name, self.name)
+
+    def _load(self) -> "SentenceTransformer":
+        raise NotImplementedError
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    def _load(self) -> "SentenceTransformer":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name, device="cpu")
+
+
+class TorchInt8Backend(EmbeddingBackend):
+    name = "torch-int8"
+
+    def _load(self) -> "SentenceTransformer":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+    file_name = None
+
+    def _load(self) -> "SentenceTransformer":
+        from sentence_transformers import SentenceTransformer
+
+        model_kwargs = {"file_name": self.file_name} if self.file_name else None
+        try:
+            return SentenceTransformer(
+                self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs
+            )
+        except (ImportError, TypeError) as e:
+            # TypeError: sentence-transformers < 3.2 has no backend argument
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={self.name} needs sentence-transformers>=3.2 "
+                f"and optimum[onnxruntime]: {e}"
+            ) from e
+
+
+class OnnxInt8Backend(OnnxBackend):
+    name = "onnx-int8"
+    file_name = ONNX_INT8_FILE
+
+
+BACKENDS: Dict[str, Type[EmbeddingBackend]] = {
+    cls.name: cls for cls in (TorchBackend, TorchInt8Backend, OnnxBackend, OnnxInt8Backend)
+}
+
+
+def load_backend(model_name: str, backend: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    cls = BACKENDS.get(backend)
+    if cls is None:
+        raise ValueError(f"Unknown embedding backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    logger.info(f"Loading embedding model: {model_name} ({backend})")
+    return cls(model_name)
+
+
+def compare_backends(
+    reference: EmbeddingBackend,
+    candidate: EmbeddingBackend,
+    texts: List[str],
+    batch_size: int = 32,
+    repeat: int = 3,
+) -> Dict[str, float]:
+    """Cosine agreement between two backends on texts, plus their encode throughput."""
+
+    def run(backend: EmbeddingBackend) -> Tuple[np.ndarray, float]:
+        backend.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            vectors = backend.encode(texts, batch_size=batch_size)
+        return np.asarray(vectors, dtype=np.float32), len(texts) * repeat / (time.perf_counter() - start)
+
+    ref_vectors, ref_rate = run(reference)
+    cand_vectors, cand_rate = run(candidate)
+    ref_vectors /= np.linalg.norm(ref_vectors, axis=1, keepdims=True)
+    cand_vectors /= np.linalg.norm(cand_vectors, axis=1, keepdims=True)
+    cosine = np.einsum("ij,ij->i", ref_vectors, cand_vectors)
+
+    return {
+        "texts": len(texts),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+        "reference_texts_per_sec": round(ref_rate, 1),
+        "candidate_texts_per_sec": round(cand_rate, 1),
+        "speedup": round(cand_rate / ref_rate, 2),
+    }
+
+
+def _corpus_texts(path: str) -> List[str]:
+    with open(path) as f:
+        corpus = json.load(f)
+    texts = [c["text"] for doc in corpus["documents"] for c in doc["clauses"]]
+    return texts + [q["query"] for q in corpus.get("queries", [])]
+
+
+if __name__ == "__main__":
+    from app.services.vector_store import DEFAULT_EMBEDDING_MODEL
+
+    default_corpus = os.path.join(
+        os.path.dirname(__file__), "..", "evaluation", "benchmark_corpus.json"
+    )
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the reference")
+    parser.add_argument("--candidate", default="onnx-int8", choices=list(BACKENDS))
+    parser.add_argument("--reference", default=REFERENCE_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--corpus", default=default_corpus)
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="fail if any text's cosine similarity falls below this")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = compare_backends(
+        load_backend(args.model, args.reference),
+        load_backend(args.model, args.candidate),
+        _corpus_texts(args.corpus),
+    )
+    report.update({"reference": args.reference, "candidate": args.candidate})
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report["cosine_min"] >= args.min_cosine else 1)
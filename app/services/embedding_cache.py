@@ -0,0 +1,330 @@
+"""
+app/services/embedding_cache.py
+Content-hash embedding cache placed in front of the embedding model.
+
+Entries are keyed by (model name, sha256 of whitespace-normalized text).
+Lookups go through a bounded in-memory LRU first, then an optional on-disk
+tier made of a memory-mapped float32 matrix per model plus an append-only
+key log, so embeddings survive restarts and are shared between re-ingests
+and between worker processes pointing at the same EMBED_CACHE_DIR.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "50000"))
+# Directory for the persistent tier; unset disables it
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR") or None
+EMBED_CACHE_DISK_ROWS = int(os.getenv("EMBED_CACHE_DISK_ROWS", "500000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    Fixed-capacity ring of embeddings for one model, shareable by several
+    processes (uvicorn workers) pointing at the same directory.
+    <base>.f32  -> np.memmap of shape (capacity, dim)
+    <base>.keys -> append-only "row hash" log; the last line for a row wins
+                   and the last line overall marks the shared write head
+    <base>.json -> {"dim": ..., "capacity": ...}
+    <base>.lock -> flock: exclusive for writes, shared for reads
+
+    Every process replays the log lines other processes appended before it
+    reads or writes, so all of them agree on the row of each key and on the
+    write head. A row's vector is flushed before its log line is appended.
+    """
+
+    def __init__(self, directory: str, model_name: str, capacity: int):
+        os.makedirs(directory, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.base = os.path.join(directory, safe_name)
+        self.capacity = capacity
+        self.vectors: Optional[np.memmap] = None
+        self.index: Dict[str, int] = {}
+        self.row_keys: Dict[int, str] = {}
+        self.next_row = 0
+        self._log = None
+        self._reader = None
+        self._reader_inode: Optional[int] = None
+        self._lock_file = open(self.base + ".lock", "a")
+        with self._locked(fcntl.LOCK_EX):
+            self._load()
+
+    @contextmanager
+    def _locked(self, mode: int) -> Iterator[None]:
+        fcntl.flock(self._lock_file.fileno(), mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open_vectors(self) -> bool:
+        meta_path = self.base + ".json"
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.capacity = meta["capacity"]
+        self.vectors = np.memmap(
+            self.base + ".f32", dtype=np.float32, mode="r+", shape=(self.capacity, meta["dim"])
+        )
+        return True
+
+    def _load(self) -> None:
+        if not self._open_vectors():
+            return
+        keys_path = self.base + ".keys"
+        lines = self._catch_up()
+
+        # Compact the log once it is mostly overwritten entries. Rows are
+        # written in ring order so the last line still marks the write head.
+        # Other processes see the new inode and replay the compacted log.
+        if lines > 2 * self.capacity:
+            tmp_path = f"{keys_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                for i in range(self.capacity):
+                    row = (self.next_row + i) % self.capacity
+                    key = self.row_keys.get(row)
+                    if key is not None and self.index.get(key) == row:
+                        f.write(f"{row} {key}\n")
+            os.replace(tmp_path, keys_path)
+            self._catch_up()
+
+        self._log = open(keys_path, "a")
+        logger.info(f"Embedding disk cache loaded: {len(self.index)} entries from {self.base}")
+
+    def _catch_up(self) -> int:
+        """Replays log lines appended since the last call; returns how many were read."""
+        keys_path = self.base + ".keys"
+        try:
+            inode = os.stat(keys_path).st_ino
+        except FileNotFoundError:
+            return 0
+        if inode != self._reader_inode:
+            # first read, or the log was compacted: rebuild from the start
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = open(keys_path)
+            self._reader_inode = inode
+            self.index.clear()
+            self.row_keys.clear()
+            self.next_row = 0
+        lines = 0
+        for line in self._reader:
+            parts = line.split()
+            if len(parts) != 2:
+                continue
+            row, key = int(parts[0]), parts[1]
+            self._assign(row, key)
+            self.next_row = (row + 1) % self.capacity
+            lines += 1
+        return lines
+
+    def _create(self, dim: int) -> None:
+        # called under the exclusive lock; another process may have won the race
+        if self._open_vectors():
+            self._catch_up()
+        else:
+            self.vectors = np.memmap(
+                self.base + ".f32", dtype=np.float32, mode="w+", shape=(self.capacity, dim)
+            )
+            self.vectors.flush()
+            tmp_path = f"{self.base}.json.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"dim": dim, "capacity": self.capacity}, f)
+            os.replace(tmp_path, self.base + ".json")
+        self._log = open(self.base + ".keys", "a")
+
+    def _assign(self, row: int, key: str) -> None:
+        old = self.row_keys.get(row)
+        if old is not None and self.index.get(old) == row:
+            del self.index[old]
+        self.index[key] = row
+        self.row_keys[row] = key
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if self.vectors is None and not os.path.exists(self.base + ".json"):
+            return None
+        with self._locked(fcntl.LOCK_SH):
+            if self.vectors is None:
+                if not self._open_vectors():
+                    return None
+                self._log = open(self.base + ".keys", "a")
+            self._catch_up()
+            row = self.index.get(key)
+            if row is None:
+                return None
+            return np.array(self.vectors[row])
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        with self._locked(fcntl.LOCK_EX):
+            if self.vectors is None:
+                self._create(int(items[0][1].shape[0]))
+            self._catch_up()
+            written = []
+            for key, vector in items:
+                if key in self.index or vector.shape[0] != self.vectors.shape[1]:
+                    continue
+                row = self.next_row
+                self.vectors[row] = vector
+                self._assign(row, key)
+                self.next_row = (row + 1) % self.capacity
+                written.append(f"{row} {key}\n")
+            if not written:
+                return
+            # vectors must be on disk before the log points at them
+            self.vectors.flush()
+            self._log.write("".join(written))
+            self._log.flush()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_entries: int = EMBED_CACHE_SIZE,
+        disk_directory: Optional[str] = EMBED_CACHE_DIR,
+        disk_rows: int = EMBED_CACHE_DISK_ROWS,
+    ):
+        self.max_entries = max_entries
+        self.disk_directory = disk_directory
+        self.disk_rows = disk_rows
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._disk: Dict[str, _DiskTier] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_tier(self, model_name: str) -> Optional[_DiskTier]:
+        if not self.disk_directory:
+            return None
+        tier = self._disk.get(model_name)
+        if tier is None:
+            tier = _DiskTier(self.disk_directory, model_name, self.disk_rows)
+            self._disk[model_name] = tier
+        return tier
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model_name: str, digest: str) -> Optional[np.ndarray]:
+        key = (model_name, digest)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            tier = self._disk_tier(model_name)
+            vector = tier.get(digest) if tier else None
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+
+            self.misses += 1
+            return None
+
+    def put_many(self, model_name: str, digests: List[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            tier = self._disk_tier(model_name)
+            items = []
+            for digest, vector in zip(digests, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember((model_name, digest), vector)
+                items.append((digest, vector))
+            if tier:
+                tier.put_many(items)
+
+    def embed(
+        self,
+        model_name: str,
+        texts: List[str],
+        encode: Callable[[List[str]], np.ndarray],
+    ) -> List[List[float]]:
+        """
+        Returns embeddings for texts, calling encode() only once for the
+        distinct texts that are not cached yet.
+        """
+        digests = [text_hash(t) for t in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        pending: Dict[str, List[int]] = {}
+        for i, digest in enumerate(digests):
+            if digest in pending:
+                pending[digest].append(i)
+                continue
+            cached = self.get(model_name, digest)
+            if cached is not None:
+                vectors[i] = cached
+            else:
+                pending[digest] = [i]
+
+        if pending:
+            miss_digests = list(pending.keys())
+            miss_texts = [texts[pending[d][0]] for d in miss_digests]
+            encoded = np.asarray(encode(miss_texts), dtype=np.float32)
+            self.put_many(model_name, miss_digests, encoded)
+            for digest, vector in zip(miss_digests, encoded):
+                for i in pending[digest]:
+                    vectors[i] = vector
+
+        return [v.tolist() for v in vectors]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": sum(len(t.index) for t in self._disk.values()),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
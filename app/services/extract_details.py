@@ -2,31 +2,83 @@ import re
 from typing import Dict, List
 
 date_pattern = re.compile(r"(\b\d{1,2}\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\b|\b\d{4}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b)", flags=re.I)
-party_pattern = re.compile(r"(party\s+[A-Z]|\bparty\s+[A-Z][a-zA-Z0-9_]*\b|between\s+([A-Z][\w\s,]+)\s+and\s+([A-Z][\w\s,]+))", flags=re.I)
+# Party names are runs of whitespace-separated words, capped at 13 words each, so
+# a failed "between ... and ..." match cannot backtrack over the whole sentence.
+party_pattern = re.compile(r"(party\s+[A-Z]|\bparty\s+[A-Z][a-zA-Z0-9_]*\b|between\s+([A-Z][\w,]*(?:\s+[\w,]+){0,12}?)\s+and\s+([A-Z][\w,]*(?:\s+[\w,]+){0,12}))", flags=re.I)
+
+# One alternation per category; a single search pass tells which categories a sentence hits
+clause_pattern = re.compile(
+    r"(?P<obligations>\b(?:shall|must|will|agree|agrees|obligat)\b)"
+    r"|(?P<termination>\b(?:terminate|termination|terminate this agreement|termination may)\b)"
+    r"|(?P<penalties>\b(?:penalti|penalty|fine|liquidated damages)\b)",
+    flags=re.I,
+)
+CLAUSE_CATEGORIES = ("obligations", "termination", "penalties")
+
+# Unterminated text kept between feed() calls before it is scanned anyway
+MAX_PENDING_CHARS = 65536
 
-def extract_important_details(text: str) -> Dict[str, List[str]]:
-    text = text or ""
-    dates = list({m.group(0).strip() for m in date_pattern.finditer(text)})
 
-    parties = []
-    for m in party_pattern.finditer(text):
-        parties.append(m.group(0).strip())
+class ClauseScanner:
+    """
+    Walks text once, "."-delimited segment by segment. Dates and parties are
+    matched per segment (neither pattern can span a "."), and every line of
+    the segment is classified into all clause categories in one regex pass.
 
-    obligations = []
-    for s in re.split(r"[.\n]", text):
-        if re.search(r"\b(shall|must|will|agree|agrees|obligat)\b", s, flags=re.I):
-            obligations.append(s.strip())
+    Text can be fed incrementally (e.g. page by page); only the unterminated
+    tail is buffered between calls.
+    """
 
-    termination = [s.strip() for s in re.split(r"[.\n]", text) if re.search(r"\b(terminate|termination|terminate this agreement|termination may)\b", s, flags=re.I)]
+    def __init__(self):
+        self._pending = ""
+        self._dates: Dict[str, None] = {}
+        self.parties: List[str] = []
+        self.clauses: Dict[str, List[str]] = {c: [] for c in CLAUSE_CATEGORIES}
 
-    penalties = [s.strip() for s in re.split(r"[.\n]", text) if re.search(r"\b(penalti|penalty|fine|liquidated damages)\b", s, flags=re.I)]
+    def feed(self, text: str) -> None:
+        data = self._pending + (text or "")
+        end = data.rfind(".")
+        if end == -1 and len(data) > MAX_PENDING_CHARS:
+            end = data.rfind("\n")
+        if end == -1:
+            self._pending = data
+            return
+        self._pending = data[end + 1:]
+        for segment in data[:end].split("."):
+            self._scan_segment(segment)
 
-    return {
-        "parties": parties,
-        "dates": dates,
-        "obligations": obligations,
-        "termination": termination,
-        "penalties": penalties,
-        "risks": []
-    }
+    def _scan_segment(self, segment: str) -> None:
+        for m in date_pattern.finditer(segment):
+            self._dates.setdefault(m.group(0).strip(), None)
+        for m in party_pattern.finditer(segment):
+            self.parties.append(m.group(0).strip())
+        for line in segment.split("\n"):
+            hits = set()
+            for m in clause_pattern.finditer(line):
+                hits.add(m.lastgroup)
+                if len(hits) == len(CLAUSE_CATEGORIES):
+                    break
+            if hits:
+                stripped = line.strip()
+                for category in CLAUSE_CATEGORIES:
+                    if category in hits:
+                        self.clauses[category].append(stripped)
 
+    def result(self) -> Dict[str, List[str]]:
+        if self._pending:
+            pending, self._pending = self._pending, ""
+            self._scan_segment(pending)
+        return {
+            "parties": list(self.parties),
+            "dates": list(self._dates),
+            "obligations": list(self.clauses["obligations"]),
+            "termination": list(self.clauses["termination"]),
+            "penalties": list(self.clauses["penalties"]),
+            "risks": []
+        }
+
+
+def extract_important_details(text: str) -> Dict[str, List[str]]:
+    scanner = ClauseScanner()
+    scanner.feed(text or "")
+    return scanner.result()
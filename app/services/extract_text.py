@@ -1,17 +1,207 @@
 import pdfplumber
 import docx
-import pytesseract
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
 import magic     # Using this for MIME sniffing
 import io
+import json
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 
-def extract_text_from_pdf(file_bytes):
+from app.services.ocr import ocr_pages
+from app.services.stage_executor import in_pool_worker, mark_pool_worker
+
+# Parallel PDF extraction settings
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# Only this much of the file is handed to libmagic for MIME sniffing
+MAGIC_HEADER_BYTES = 8192
+# Size of the pieces iter_text_pages yields for formats without pages
+TEXT_BLOCK_CHARS = 65536
+
+# A PDF given as raw bytes, a path on disk, or a seekable binary file
+PdfSource = Union[bytes, str, BinaryIO]
+
+# Shared page-range pool, created on first use and reused by every document
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=mark_pool_worker,
+            )
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pdf_pool() -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _open_pdf(source: PdfSource):
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    if isinstance(source, str):
+        return pdfplumber.open(source)
+    source.seek(0)
+    return pdfplumber.open(source)
+
+
+def _extract_page_texts(pdf, start: int, end: int) -> List[str]:
+    texts = []
+    for page in pdf.pages[start:end]:
+        texts.append(page.extract_text() or "")
+        # release the parsed page objects as we go
+        if hasattr(page, "close"):
+            page.close()
+    return texts
+
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> List[str]:
+    with pdfplumber.open(path) as pdf:
+        return _extract_page_texts(pdf, start, end)
+
+
+def iter_pdf_pages(
+    source: PdfSource,
+    workers: Optional[int] = None,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) for every page, in order, page numbers starting at 1.
+    Documents with at least PDF_PARALLEL_MIN_PAGES pages are split into page
+    ranges across the shared PDF pool, whose workers open the document by
+    path (in-memory documents are spilled to a temp file first). At most two
+    ranges per worker are in flight, so results are streamed rather than
+    accumulated. Inside a stage or bulk-ingest pool worker the pages are read
+    serially: those pools already run one document per core.
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    with _open_pdf(source) as pdf:
+        page_count = len(pdf.pages)
+        if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES or in_pool_worker():
+            for start in range(0, page_count, pages_per_task):
+                texts = _extract_page_texts(pdf, start, start + pages_per_task)
+                for offset, text in enumerate(texts):
+                    yield start + offset + 1, text
+            return
+
+    ranges = [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    path, spilled = _pdf_path(source)
+    pool = _get_pdf_pool()
+    pending = deque()
     try:
-        with pdfplumber.open(file_bytes) as pdf:
-            return "\n".join([page.extract_text() or "" for page in pdf.pages])
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                start, end = ranges[next_range]
+                pending.append((start, pool.submit(_extract_pdf_page_range, path, start, end)))
+                next_range += 1
+            start, future = pending.popleft()
+            try:
+                texts = future.result()
+            except BrokenProcessPool:
+                _discard_pdf_pool(pool)
+                raise
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+    finally:
+        # the pool is shared: cancel only this document's ranges
+        for _, future in pending:
+            future.cancel()
+        if spilled:
+            os.unlink(path)
+
+
+def needs_pdf_fanout(path: str, filename: Optional[str] = None) -> bool:
+    """
+    True when path is a PDF big enough for iter_pdf_pages to split across
+    the shared PDF pool. Pool workers read pages serially, so callers run
+    such documents on a thread of the parent process instead.
+    """
+    if PDF_WORKERS <= 1 or in_pool_worker():
+        return False
+    try:
+        with open(path, "rb") as f:
+            if detect_file_type(filename or os.path.basename(path), f) != "pdf":
+                return False
+        with pdfplumber.open(path) as pdf:
+            return len(pdf.pages) >= PDF_PARALLEL_MIN_PAGES
+    except Exception:
+        # unreadable or unsupported: the normal extraction path reports it
+        return False
+
+
+def _pdf_path(source: PdfSource) -> Tuple[str, bool]:
+    """A path the pool workers can open, and whether it is a temp file to delete."""
+    if isinstance(source, str):
+        return source, False
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, False
+    fd, path = tempfile.mkstemp(prefix="pdf_", suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(_read_all(source))
+    return path, True
+
+
+def _read_all(file_bytes) -> bytes:
+    if isinstance(file_bytes, (bytes, bytearray)):
+        return bytes(file_bytes)
+    if hasattr(file_bytes, "getvalue"):
+        return file_bytes.getvalue()
+    file_bytes.seek(0)
+    return file_bytes.read()
+
+
+def _file_descriptor(stream):
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError):
+        # BytesIO raises io.UnsupportedOperation, an OSError subclass
+        return None
+
+
+def extract_pdf_pages(file_bytes) -> Iterator[Tuple[int, str]]:
+    """Page-streaming PDF extraction: yields (page_number, text) in order."""
+    try:
+        yield from iter_pdf_pages(file_bytes)
     except Exception:
         raise ValueError("Failed to read PDF file")
 
+
+def extract_text_from_pdf(file_bytes):
+    return "\n".join(text for _, text in extract_pdf_pages(file_bytes))
+
 def extract_text_from_docx(file_bytes):
     try:
         doc = docx.Document(file_bytes)
@@ -21,63 +211,189 @@ def extract_text_from_docx(file_bytes):
 
 def extract_text_from_txt(file_bytes):
     try:
+        file_bytes.seek(0)
         return file_bytes.read().decode("utf-8", errors="ignore")
     except Exception:
         raise ValueError("Failed to read TXT file")
 
-def extract_text_from_image(file_bytes):
+def extract_image_pages(file_bytes) -> List[str]:
+    """OCR text of every frame of an image, one entry per page."""
     try:
-        image = Image.open(file_bytes)
-        return pytesseract.image_to_string(image)
+        fd = _file_descriptor(file_bytes)
+        if fd is None:
+            return ocr_pages(_read_all(file_bytes))
+        # files on disk are mapped rather than read into memory
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            return ocr_pages(mapped)
     except UnidentifiedImageError:
         raise ValueError("Invalid image file")
     except Exception:
         raise ValueError("Failed to extract text via OCR")
 
+def extract_text_from_image(file_bytes):
+    return "\n".join(extract_image_pages(file_bytes))
+
 def extract_text_from_file(upload_file):
     """
     Detect file type using BOTH:
     - MIME-Type sniffing (magic library)
     - filename extension 
     
-    Extract text accordingly.
+    Extract text accordingly. The upload's spooled file is handed to the
+    extractors as is; it is never read into memory as a whole.
     """
 
-    filename = upload_file.filename.lower()
-    raw_bytes = upload_file.file.read()
-    file_bytes = io.BytesIO(raw_bytes)
-    file_bytes.seek(0)
+    return extract_text_from_stream(upload_file.filename, upload_file.file)
+
+
+def extract_text_from_path(path, filename=None):
+    """
+    Extracts a file on disk; used by worker processes. filename, when given,
+    is used for the extension fallback instead of the (temporary) path.
+    """
+    with open(path, "rb") as f:
+        return extract_text_from_stream(filename or os.path.basename(path), f)
+
+
+def extract_text_from_zip_member(zip_path, member):
+    """Extracts one member of a zip archive without unpacking the archive."""
+    with zipfile.ZipFile(zip_path) as archive:
+        return extract_text_from_bytes(os.path.basename(member), archive.read(member))
+
+
+def extract_text_from_bytes(filename, raw_bytes):
+    """
+    Same as extract_text_from_file but takes the filename and raw bytes
+    directly, so it can run in a worker process (UploadFile is not picklable).
+    """
+
+    return extract_text_from_stream(filename, io.BytesIO(raw_bytes))
 
+
+def _sniff_mime_type(stream):
     try:
-        mime_type = magic.from_buffer(raw_bytes, mime=True)
+        stream.seek(0)
+        header = stream.read(MAGIC_HEADER_BYTES)
+        stream.seek(0)
+        return magic.from_buffer(header, mime=True)
     except:
-        mime_type = None
+        return None
+
+
+def detect_file_type(filename, stream):
+    """
+    Returns "pdf", "docx", "txt" or "image" from MIME sniffing, falling back
+    to the filename extension. Only the first MAGIC_HEADER_BYTES are read.
+    """
+
+    filename = (filename or "").lower()
+    mime_type = _sniff_mime_type(stream)
 
     if mime_type:
-        # PDF
         if mime_type == "application/pdf":
-            return extract_text_from_pdf(file_bytes)
-        # DOCX
+            return "pdf"
         if mime_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-            return extract_text_from_docx(file_bytes)
-        # Plain text
+            return "docx"
         if mime_type.startswith("text/"):
-            return extract_text_from_txt(io.BytesIO(raw_bytes))
-        # Images
+            return "txt"
         if mime_type.startswith("image/"):
-            return extract_text_from_image(io.BytesIO(raw_bytes))
+            return "image"
 
     if filename.endswith(".pdf"):
-        return extract_text_from_pdf(file_bytes)
-
+        return "pdf"
     if filename.endswith(".docx"):
-        return extract_text_from_docx(file_bytes)
-
+        return "docx"
     if filename.endswith(".txt"):
-        return extract_text_from_txt(io.BytesIO(raw_bytes))
-
+        return "txt"
     if filename.endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
-        return extract_text_from_image(io.BytesIO(raw_bytes))
+        return "image"
 
     raise ValueError(f"Unsupported file format: {filename}")
 
+
+def extract_text_from_stream(filename, stream):
+    """
+    Dispatches a seekable binary stream to the matching extractor. pdfplumber
+    and python-docx read the stream themselves, images on disk are
+    memory-mapped.
+    """
+
+    file_type = detect_file_type(filename, stream)
+    if file_type == "pdf":
+        return extract_text_from_pdf(stream)
+    if file_type == "docx":
+        return extract_text_from_docx(stream)
+    if file_type == "txt":
+        return extract_text_from_txt(stream)
+    return extract_text_from_image(stream)
+
+
+def _iter_blocks(lines: Iterator[str], block_chars: int = TEXT_BLOCK_CHARS) -> Iterator[Tuple[Optional[int], str]]:
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_chars:
+            yield None, "\n".join(block)
+            block, size = [], 0
+    if block:
+        yield None, "\n".join(block)
+
+
+def iter_text_pages(filename, stream) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Yields (page_number, text) pieces of a document without building the
+    whole text. PDFs and images yield real pages (numbered from 1); DOCX and
+    plain text have no pages and yield blocks of about TEXT_BLOCK_CHARS with
+    page_number None.
+    """
+
+    file_type = detect_file_type(filename, stream)
+    if file_type == "pdf":
+        yield from extract_pdf_pages(stream)
+    elif file_type == "docx":
+        try:
+            paragraphs = docx.Document(stream).paragraphs
+        except Exception:
+            raise ValueError("Failed to read DOCX file")
+        yield from _iter_blocks(p.text for p in paragraphs)
+    elif file_type == "txt":
+        stream.seek(0)
+        reader = io.TextIOWrapper(stream, encoding="utf-8", errors="ignore", newline="")
+        try:
+            yield from _iter_blocks(line.rstrip("\r\n") for line in reader)
+        finally:
+            # leave the underlying stream open for the caller
+            reader.detach()
+    else:
+        yield from enumerate(extract_image_pages(stream), start=1)
+
+
+def iter_text_pages_from_path(path, filename=None) -> Iterator[Tuple[Optional[int], str]]:
+    with open(path, "rb") as f:
+        yield from iter_text_pages(filename or os.path.basename(path), f)
+
+
+def spool_text_pages(path, filename=None) -> str:
+    """
+    Writes iter_text_pages_from_path to a JSON-lines temp file, one
+    [page, text] pair per line, and returns its path. Runs in a worker
+    process so parsing and OCR stay off the caller's threads; the caller
+    streams the pages back with iter_spooled_pages and unlinks the file.
+    """
+    fd, pages_path = tempfile.mkstemp(prefix="pages_", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            for page, text in iter_text_pages_from_path(path, filename):
+                out.write(json.dumps([page, text]) + "\n")
+    except BaseException:
+        os.unlink(pages_path)
+        raise
+    return pages_path
+
+
+def iter_spooled_pages(pages_path) -> Iterator[Tuple[Optional[int], str]]:
+    with open(pages_path, encoding="utf-8") as f:
+        for line in f:
+            page, text = json.loads(line)
+            yield page, text
@@ -1,19 +1,26 @@
+import hashlib
+import logging
 import re
+import threading
+import time
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 
-from app.util.chunker import smart_chunker
-from app.services.vector_store import VectorStore
-from transformers import AutoTokenizer
+from app.util.chunker import StreamingChunker, get_tokenizer
+from app.util.instrumentation import CHUNK_SECONDS, CHUNKS_PER_DOCUMENT, record_timing
+from app.services.vector_store import get_vector_store
+from app.services.doc_registry import get_doc_registry
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+# Chunks diffed, embedded and written together while streaming a document
+INGEST_BATCH_SIZE = 64
 
-vs = VectorStore(
-    collection_name="legal_docs",
-    persist_directory="./chroma_db",
-    embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
-)
+# Serializes diff + write per doc_id so concurrent re-uploads can't interleave
+_doc_locks: Dict[str, threading.Lock] = {}
+_doc_locks_guard = threading.Lock()
 
 
 def clean_text(text: str) -> str:
@@ -22,32 +29,196 @@ def clean_text(text: str) -> str:
     return text
 
 
-def ingest_document(text: str, doc_id: str = None) -> Dict[str, Any]:
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def _doc_lock(doc_id: str) -> threading.Lock:
+    with _doc_locks_guard:
+        return _doc_locks.setdefault(doc_id, threading.Lock())
+
+
+def chunk_metadata(
+    doc_id: str,
+    index: int,
+    hash_: str,
+    page_start: Optional[int] = None,
+    page_end: Optional[int] = None,
+) -> Dict[str, Any]:
+    meta = {
+        "doc_id": doc_id,
+        "chunk_index": index,
+        "clause_id": f"{doc_id}_clause_{index}",
+        "chunk_hash": hash_,
+    }
+    # pages are only known for paged sources (PDF, images)
+    if page_start is not None:
+        meta["page_start"] = page_start
+        meta["page_end"] = page_end if page_end is not None else page_start
+    return meta
+
+
+def make_chunk_id(doc_id: str, hash_: str, taken: Set[str]) -> str:
+    """Content-addressed chunk id; repeated content within a document gets a suffix."""
+    id_ = f"{doc_id}_chunk_{hash_[:16]}"
+    n = 1
+    while id_ in taken:
+        id_ = f"{doc_id}_chunk_{hash_[:16]}_{n}"
+        n += 1
+    taken.add(id_)
+    return id_
+
+
+def iter_clean_pages(pages: Iterable[Tuple[Optional[int], str]]) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Incremental clean_text: pieces are cleaned one by one and empty ones
+    dropped. Joined with single spaces they equal clean_text of the
+    whitespace-joined pieces.
+    """
+    for page, text in pages:
+        cleaned = clean_text(text or "")
+        if cleaned:
+            yield page, cleaned
+
+
+def _stored_chunks(vs, doc_id: str):
+    """hash -> stored ids, plus the stored metadata per id, for doc_id's existing chunks."""
+    existing = vs.get_document_chunks(doc_id, include=["metadatas"])
+    metadatas = existing["metadatas"]
+    if any(not (m or {}).get("chunk_hash") for m in metadatas) or len(metadatas) < len(existing["ids"]):
+        # rows written before chunk hashes existed are hashed from their text
+        existing = vs.get_document_chunks(doc_id, include=["metadatas", "documents"])
+
+    stored: Dict[str, List[str]] = {}
+    stored_meta: Dict[str, Dict[str, Any]] = {}
+    for i, id_ in enumerate(existing["ids"]):
+        meta = existing["metadatas"][i] if i < len(existing["metadatas"]) else None
+        meta = meta or {}
+        h = meta.get("chunk_hash")
+        if not h:
+            docs = existing["documents"]
+            h = chunk_hash(docs[i] or "") if i < len(docs) else ""
+        stored.setdefault(h, []).append(id_)
+        stored_meta[id_] = meta
+    return stored, stored_meta, set(existing["ids"])
+
+
+def ingest_pages(
+    pages: Iterable[Tuple[Optional[int], str]],
+    doc_id: str = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Incremental, content-addressed ingestion from a stream of
+    (page_number, text) pieces.
+    Pieces are cleaned and chunked as they arrive (the chunk overlap carries
+    across page boundaries), and every batch_size chunks are hashed, diffed
+    against the chunks already stored for doc_id and written: unchanged
+    chunks are kept (only their metadata is rewritten if their position
+    moved), new or edited chunks are embedded and upserted, and chunks that
+    disappeared from the document are deleted at the end. Memory holds one
+    batch of chunks, not the document.
+    If the stream or a write fails part way, the chunks added by this run
+    are deleted and moved chunks get their old metadata back before the
+    error is re-raised, so the stored document stays the previous version.
+    """
     if doc_id is None:
         doc_id = str(uuid.uuid4())
 
-    cleaned = clean_text(text)
-    if not cleaned or len(cleaned) < 20:
-        return {"status": "error", "message": "Document empty or too short"}
-
-    chunks = smart_chunker(
-        cleaned,
-        tokenizer=tokenizer,
-        max_tokens=256,
-        overlap=20,
-    )
-
-    ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-    metadatas = [
-        {
-             "doc_id": doc_id,
-             "chunk_index": i,
-             "clause_id": f"{doc_id}_clause_{i}"
-        }
-        for i in range(len(chunks))
-    ]
-
-    vs.add_documents(ids=ids, documents=chunks, metadatas=metadatas, batch_size=50)
-
-    return {"status": "success", "doc_id": doc_id, "chunks_created": len(chunks)}
+    chunker = StreamingChunker(tokenizer=get_tokenizer(TOKENIZER_NAME), max_tokens=256, overlap=20)
+    vs = get_vector_store()
+    counts = {"chunks": 0, "embedded": 0, "chars": 0}
+    chunk_seconds = 0.0
+
+    with _doc_lock(doc_id):
+        stored, stored_meta, taken = _stored_chunks(vs, doc_id)
+        # undo log for a failed run: ids this run added, ids whose metadata it moved
+        added_ids: List[str] = []
+        moved_before: Dict[str, Dict[str, Any]] = {}
+
+        def write(batch: List[Dict[str, Any]]) -> None:
+            new_ids, new_docs, new_metas = [], [], []
+            moved_ids, moved_metas = [], []
+            for chunk in batch:
+                h = chunk_hash(chunk["text"])
+                meta = chunk_metadata(doc_id, counts["chunks"], h, chunk["page_start"], chunk["page_end"])
+                counts["chunks"] += 1
+                reusable = stored.get(h)
+                if reusable:
+                    id_ = reusable.pop(0)
+                    if stored_meta[id_] != meta:
+                        moved_ids.append(id_)
+                        moved_metas.append(meta)
+                    continue
+
+                new_ids.append(make_chunk_id(doc_id, h, taken))
+                new_docs.append(chunk["text"])
+                new_metas.append(meta)
+
+            added_ids.extend(new_ids)
+            for id_ in moved_ids:
+                moved_before.setdefault(id_, stored_meta[id_])
+            if new_ids:
+                vs.upsert_documents(ids=new_ids, documents=new_docs, metadatas=new_metas, batch_size=50)
+            if moved_ids:
+                vs.update_metadatas(moved_ids, moved_metas)
+            counts["embedded"] += len(new_ids)
+
+        batch: List[Dict[str, Any]] = []
+        try:
+            for page, text in iter_clean_pages(pages):
+                counts["chars"] += len(text) + (1 if counts["chars"] else 0)
+                started = time.perf_counter()
+                batch.extend(chunker.feed(text, page))
+                chunk_seconds += time.perf_counter() - started
+                while len(batch) >= batch_size:
+                    write(batch[:batch_size])
+                    del batch[:batch_size]
+
+            started = time.perf_counter()
+            batch.extend(chunker.finish())
+            chunk_seconds += time.perf_counter() - started
+            CHUNK_SECONDS.observe(chunk_seconds)
+            record_timing("chunk", chunk_seconds)
+
+            # nothing has been written yet: a chunk needs far more than 20 characters
+            if counts["chars"] < 20:
+                return {"status": "error", "message": "Document empty or too short"}
+
+            for i in range(0, len(batch), batch_size):
+                write(batch[i : i + batch_size])
+        except BaseException:
+            _rollback(vs, doc_id, added_ids, moved_before)
+            raise
+
+        removed_ids = [id_ for ids in stored.values() for id_ in ids]
+        if removed_ids:
+            vs.delete_by_id(removed_ids)
+        get_doc_registry().upsert(doc_id, counts["chunks"])
+
+    CHUNKS_PER_DOCUMENT.observe(counts["chunks"])
+    return {
+        "status": "success",
+        "doc_id": doc_id,
+        "chunks_created": counts["chunks"],
+        "chunks_embedded": counts["embedded"],
+        "chunks_unchanged": counts["chunks"] - counts["embedded"],
+        "chunks_deleted": len(removed_ids),
+    }
+
+
+def _rollback(vs, doc_id: str, added_ids: List[str], moved_before: Dict[str, Dict[str, Any]]) -> None:
+    """Undoes a failed ingest_pages run; the original error is what the caller sees."""
+    try:
+        if added_ids:
+            vs.delete_by_id(added_ids)
+        if moved_before:
+            vs.update_metadatas(list(moved_before), list(moved_before.values()))
+    except Exception:
+        logger.exception("Rolling back failed ingest of %s left it partially written", doc_id)
+
+
+def ingest_document(text: str, doc_id: str = None) -> Dict[str, Any]:
+    """ingest_pages over a document that is already in memory as one string."""
+    return ingest_pages([(None, text)], doc_id=doc_id)
 
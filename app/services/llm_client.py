@@ -0,0 +1,260 @@
+"""
+app/services/llm_client.py
+Async Ollama client: pooled keep-alive connections, a semaphore sized to the
+model server's parallelism, coalescing of identical in-flight prompts, and
+timeouts/retries that surface typed errors.
+
+There is one client per event loop, so LLM_MAX_PARALLEL caps each loop, not
+the process: a second loop (bulk ingest's summarize thread) binds its own
+client with set_llm_client and its own, smaller limit.
+
+Point base_url at a local stub server (or pass an httpx transport) to test it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from app.util.instrumentation import LLM_SECONDS, LLM_TOKENS, LLM_TOKENS_PER_SECOND, record_timing
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "mistral")
+# Keep in line with OLLAMA_NUM_PARALLEL on the model server
+LLM_MAX_PARALLEL = int(os.getenv("LLM_MAX_PARALLEL", "2"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+
+class LLMError(Exception):
+    """Base class for LLM failures; status_code is the HTTP status to surface."""
+    status_code = 502
+    retryable = False
+
+
+class LLMUnavailableError(LLMError):
+    """Model server unreachable or returned a 5xx."""
+    status_code = 503
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    """Model server did not answer within the configured timeout."""
+    status_code = 504
+    retryable = True
+
+
+class LLMResponseError(LLMError):
+    """Model server rejected the request or returned an unusable body."""
+    status_code = 502
+
+
+def _record_call(mode: str, started: float, outcome: str, data: Optional[Dict[str, Any]] = None) -> None:
+    elapsed = time.perf_counter() - started
+    LLM_SECONDS.observe(elapsed, mode=mode, outcome=outcome)
+    record_timing("llm", elapsed)
+    # Ollama reports generated tokens and generation time (ns) on the final message
+    eval_count = (data or {}).get("eval_count")
+    eval_duration = (data or {}).get("eval_duration")
+    if eval_count:
+        LLM_TOKENS.inc(eval_count, mode=mode)
+        if eval_duration:
+            LLM_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), mode=mode)
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = LLM_MODEL_NAME,
+        max_parallel: int = LLM_MAX_PARALLEL,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_backoff: float = LLM_RETRY_BACKOFF,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.max_parallel = max(1, max_parallel)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_parallel)
+        self._inflight: Dict[Tuple, "asyncio.Future[str]"] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self._timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_parallel * 2,
+                    max_keepalive_connections=self.max_parallel,
+                ),
+                transport=self._transport,
+            )
+        return self._http
+
+    def _payload(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
+            }
+        }
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response) -> None:
+        if response.status_code >= 500:
+            raise LLMUnavailableError(f"Ollama returned HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise LLMResponseError(f"Ollama returned HTTP {response.status_code}: {response.text[:200]}")
+
+    async def _generate_once(self, payload: Dict[str, Any]) -> str:
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await self._client().post("/api/generate", json=payload)
+            except httpx.TimeoutException as e:
+                _record_call("generate", started, "timeout")
+                raise LLMTimeoutError(f"Ollama timed out: {e}") from e
+            except httpx.TransportError as e:
+                _record_call("generate", started, "unavailable")
+                raise LLMUnavailableError(f"Ollama unreachable: {e}") from e
+
+        try:
+            self._raise_for_status(response)
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise LLMResponseError("Ollama returned invalid JSON") from e
+            if data.get("error"):
+                raise LLMResponseError(str(data["error"]))
+        except LLMError:
+            _record_call("generate", started, "error")
+            raise
+        _record_call("generate", started, "ok", data)
+        return (data.get("response") or "").strip()
+
+    async def _generate_with_retries(self, payload: Dict[str, Any]) -> str:
+        attempt = 0
+        while True:
+            try:
+                return await self._generate_once(payload)
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"LLM call failed ({e}); retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, max_tokens: int = 256, temperature: float = 0.2) -> str:
+        """
+        Returns the full completion for prompt. Identical concurrent requests
+        share a single generation; a cancelled caller does not cancel it for
+        the others.
+        """
+        key = (self.model, prompt, max_tokens, temperature)
+        task = self._inflight.get(key)
+        if task is None:
+            payload = self._payload(prompt, max_tokens, temperature, stream=False)
+            task = asyncio.ensure_future(self._generate_with_retries(payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, prompt: str, max_tokens: int = 256, temperature: float = 0.2) -> AsyncIterator[str]:
+        """
+        Yields tokens as they are generated. Connection failures before the
+        first token are retried; failures after it are raised.
+        """
+        payload = self._payload(prompt, max_tokens, temperature, stream=True)
+        attempt = 0
+        while True:
+            started = False
+            call_started = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    async with self._client().stream("POST", "/api/generate", json=payload) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                        self._raise_for_status(response)
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            try:
+                                data = json.loads(line)
+                            except ValueError as e:
+                                raise LLMResponseError("Ollama returned invalid NDJSON") from e
+                            if data.get("error"):
+                                raise LLMResponseError(str(data["error"]))
+                            token = data.get("response")
+                            if token:
+                                started = True
+                                yield token
+                            if data.get("done"):
+                                _record_call("stream", call_started, "ok", data)
+                                return
+                _record_call("stream", call_started, "ok")
+                return
+            except httpx.TimeoutException as e:
+                error: LLMError = LLMTimeoutError(f"Ollama timed out: {e}")
+            except httpx.TransportError as e:
+                error = LLMUnavailableError(f"Ollama unreachable: {e}")
+            except LLMError as e:
+                error = e
+            _record_call("stream", call_started, "error")
+
+            if started or not error.retryable or attempt >= self.max_retries:
+                raise error
+            delay = self.retry_backoff * (2 ** attempt)
+            logger.warning(f"LLM stream failed ({error}); retrying in {delay:.1f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+# One client per event loop: httpx pools and asyncio primitives are loop-bound
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OllamaClient]" = weakref.WeakKeyDictionary()
+
+
+def get_llm_client() -> OllamaClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = OllamaClient()
+        _clients[loop] = client
+    return client
+
+
+def set_llm_client(client: OllamaClient) -> None:
+    """Binds client to the running loop in place of the default one."""
+    _clients[asyncio.get_running_loop()] = client
+
+
+async def close_llm_client() -> None:
+    loop = asyncio.get_running_loop()
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,425 @@
+"""
+app/services/numpy_index.py
+Exact (brute-force) cosine search over a contiguous embedding matrix.
+
+NumpyCollection implements the subset of the Chroma collection API that
+VectorStore uses (add / upsert / query / get / update / delete / count), so
+VectorStore can run on it unchanged. Select it with VECTOR_INDEX_BACKEND=numpy.
+
+Embeddings are L2-normalized on insert and kept in one (capacity, dim) matrix:
+a memory-mapped .npy file when persisted, a plain array otherwise. ids,
+documents and metadata live in an append-only JSONL sidecar replayed on load.
+Deleted rows are tombstoned and reused. Distances are squared L2 between
+normalized vectors (2 - 2 * cosine), matching Chroma's default space.
+
+Meant for corpora up to a few hundred thousand chunks; beyond that use Chroma.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float16")
+NUMPY_INDEX_INITIAL_ROWS = 1024
+# rows scored per matmul block, bounds the float32 temporaries for float16 storage
+_SCORE_BLOCK_ROWS = 65536
+
+_COMPARISONS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Chroma-style metadata filter ($and/$or, $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin)."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                compare = _COMPARISONS.get(op)
+                if compare is None:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                try:
+                    if not compare(value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _doc_id_scope(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """doc_ids of a pure doc_id filter (as built by build_where), else None."""
+    if not where or list(where) != ["doc_id"]:
+        return None
+    condition = where["doc_id"]
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and list(condition) == ["$in"]:
+        return list(condition["$in"])
+    if isinstance(condition, dict) and list(condition) == ["$eq"]:
+        return [condition["$eq"]]
+    return None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyCollection:
+    def __init__(
+        self,
+        name: str,
+        directory: Optional[str] = None,
+        dtype: str = NUMPY_INDEX_DTYPE,
+    ):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.directory = None
+        if directory:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+            self.directory = os.path.join(directory, safe_name)
+            os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._log = None
+        self._reset_state()
+        if self.directory:
+            self._load()
+
+    def _reset_state(self) -> None:
+        self.vectors: Optional[np.ndarray] = None
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0  # high-water mark of used rows
+        self.row_ids: List[Optional[str]] = []
+        self.documents: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.doc_rows: Dict[str, set] = {}
+        self.free_rows: List[int] = []
+
+    # ---------------- persistence ----------------
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, "rows.jsonl")
+
+    def _load(self) -> None:
+        if os.path.exists(self._matrix_path):
+            self.vectors = np.load(self._matrix_path, mmap_mode="r+")
+            self.dtype = self.vectors.dtype
+            self.alive = np.zeros(self.vectors.shape[0], dtype=bool)
+
+        lines = 0
+        if os.path.exists(self._log_path):
+            with open(self._log_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    lines += 1
+                    if entry["op"] == "put":
+                        self._assign(entry["row"], entry["id"], entry.get("document"), entry.get("metadata") or {})
+                    elif entry["op"] == "meta":
+                        self._set_metadata(entry["row"], entry.get("metadata") or {})
+                    elif entry["op"] == "del":
+                        self._release(entry["row"])
+        self.free_rows = [r for r in range(self.size) if not self.alive[r]]
+
+        if lines > 2 * len(self.id_to_row) + 1000:
+            with open(self._log_path + ".tmp", "w") as f:
+                for row in range(self.size):
+                    if self.alive[row]:
+                        f.write(self._put_line(row))
+            os.replace(self._log_path + ".tmp", self._log_path)
+
+        self._log = open(self._log_path, "a")
+        logger.info(f"NumPy index '{self.name}' loaded: {len(self.id_to_row)} rows")
+
+    def _put_line(self, row: int) -> str:
+        return json.dumps({
+            "op": "put",
+            "row": row,
+            "id": self.row_ids[row],
+            "document": self.documents[row],
+            "metadata": self.metadatas[row],
+        }) + "\n"
+
+    def _append_log(self, lines: List[str]) -> None:
+        if self._log is None:
+            return
+        if self.vectors is not None and hasattr(self.vectors, "flush"):
+            self.vectors.flush()  # vectors hit disk before the rows that point at them
+        self._log.write("".join(lines))
+        self._log.flush()
+
+    # ---------------- row bookkeeping ----------------
+
+    def _ensure_capacity(self, rows_needed: int, dim: int) -> None:
+        if self.vectors is None:
+            capacity = max(NUMPY_INDEX_INITIAL_ROWS, rows_needed)
+            self.vectors = self._allocate(capacity, dim)
+            self.alive = np.zeros(capacity, dtype=bool)
+            return
+        if self.vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match index dimension {self.vectors.shape[1]}")
+        capacity = self.vectors.shape[0]
+        if rows_needed <= capacity:
+            return
+        while capacity < rows_needed:
+            capacity *= 2
+        grown = self._allocate(capacity, dim, suffix=".grow")
+        grown[: self.size] = self.vectors[: self.size]
+        if self.directory:
+            grown.flush()
+            del self.vectors
+            os.replace(self._matrix_path + ".grow", self._matrix_path)
+            grown = np.load(self._matrix_path, mmap_mode="r+")
+        self.vectors = grown
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - self.alive.shape[0], dtype=bool)])
+
+    def _allocate(self, capacity: int, dim: int, suffix: str = "") -> np.ndarray:
+        if self.directory:
+            return np.lib.format.open_memmap(
+                self._matrix_path + suffix, mode="w+", dtype=self.dtype, shape=(capacity, dim)
+            )
+        return np.zeros((capacity, dim), dtype=self.dtype)
+
+    def _assign(self, row: int, id_: str, document: Optional[str], metadata: Dict[str, Any]) -> None:
+        while len(self.row_ids) <= row:
+            self.row_ids.append(None)
+            self.documents.append(None)
+            self.metadatas.append(None)
+        if self.alive[row]:
+            self._release(row)
+        self.row_ids[row] = id_
+        self.documents[row] = document
+        self.metadatas[row] = metadata
+        self.id_to_row[id_] = row
+        self.doc_rows.setdefault(metadata.get("doc_id"), set()).add(row)
+        self.alive[row] = True
+        self.size = max(self.size, row + 1)
+
+    def _set_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        old_doc = (self.metadatas[row] or {}).get("doc_id")
+        self.doc_rows.get(old_doc, set()).discard(row)
+        self.metadatas[row] = metadata
+        self.doc_rows.setdefault(metadata.get("doc_id"), set()).add(row)
+
+    def _release(self, row: int) -> None:
+        if row >= len(self.row_ids) or not self.alive[row]:
+            return
+        id_ = self.row_ids[row]
+        if self.id_to_row.get(id_) == row:
+            del self.id_to_row[id_]
+        self.doc_rows.get((self.metadatas[row] or {}).get("doc_id"), set()).discard(row)
+        self.row_ids[row] = None
+        self.documents[row] = None
+        self.metadatas[row] = None
+        self.alive[row] = False
+
+    def _write(self, ids, documents, metadatas, embeddings, overwrite: bool) -> None:
+        if embeddings is None:
+            raise ValueError("NumpyCollection needs precomputed embeddings")
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [{}] * len(ids)
+        vectors = _normalize(embeddings)
+
+        with self._lock:
+            # id -> (row, input index); a repeated id in one call keeps its last value
+            targets: Dict[str, tuple] = {}
+            next_row = self.size
+            for i, id_ in enumerate(ids):
+                if id_ in targets:
+                    targets[id_] = (targets[id_][0], i)
+                    continue
+                row = self.id_to_row.get(id_)
+                if row is not None and not overwrite:
+                    logger.warning(f"Add of existing ID {id_} ignored")
+                    continue
+                if row is None:
+                    if self.free_rows:
+                        row = self.free_rows.pop()
+                    else:
+                        row, next_row = next_row, next_row + 1
+                targets[id_] = (row, i)
+            if not targets:
+                return
+            rows = [row for row, _ in targets.values()]
+            keep = [i for _, i in targets.values()]
+
+            self._ensure_capacity(max(rows) + 1, vectors.shape[1])
+            self.vectors[rows] = vectors[keep].astype(self.dtype)
+            for row, i in zip(rows, keep):
+                self._assign(row, ids[i], documents[i], dict(metadatas[i] or {}))
+            self._append_log([self._put_line(row) for row in rows])
+
+    # ---------------- Chroma collection API ----------------
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None) -> None:
+        self._write(ids, documents, metadatas, embeddings, overwrite=False)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None) -> None:
+        self._write(ids, documents, metadatas, embeddings, overwrite=True)
+
+    def update(self, ids, metadatas=None, documents=None, embeddings=None) -> None:
+        with self._lock:
+            rows = [self.id_to_row.get(id_) for id_ in ids]
+            lines = []
+            if embeddings is not None:
+                vectors = _normalize(embeddings)
+                for row, vector in zip(rows, vectors):
+                    if row is not None:
+                        self.vectors[row] = vector.astype(self.dtype)
+            for i, row in enumerate(rows):
+                if row is None:
+                    continue
+                if documents is not None:
+                    self.documents[row] = documents[i]
+                if metadatas is not None:
+                    self._set_metadata(row, dict(metadatas[i] or {}))
+                if documents is not None or embeddings is not None:
+                    lines.append(self._put_line(row))
+                elif metadatas is not None:
+                    lines.append(json.dumps({"op": "meta", "row": row, "metadata": self.metadatas[row]}) + "\n")
+            self._append_log(lines)
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            if ids is not None:
+                # A repeated id must not free its row twice
+                rows = [self.id_to_row[id_] for id_ in dict.fromkeys(ids) if id_ in self.id_to_row]
+            else:
+                rows = self._candidate_rows(where).tolist()
+            rows = [row for row in rows if self.alive[row]]
+            for row in rows:
+                self._release(row)
+                self.free_rows.append(row)
+            self._append_log([json.dumps({"op": "del", "row": row}) + "\n" for row in rows])
+
+    def count(self) -> int:
+        return len(self.id_to_row)
+
+    def _candidate_rows(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows matching where, in row order."""
+        doc_ids = _doc_id_scope(where)
+        if doc_ids is not None:
+            rows = set()
+            for doc_id in doc_ids:
+                rows |= self.doc_rows.get(doc_id, set())
+            return np.array(sorted(rows), dtype=np.int64)
+        live = np.flatnonzero(self.alive[: self.size])
+        if not where:
+            return live
+        return np.array([r for r in live if matches_where(self.metadatas[r], where)], dtype=np.int64)
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> Dict[str, Any]:
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            if ids is not None:
+                rows = [self.id_to_row[id_] for id_ in ids if id_ in self.id_to_row]
+                if where:
+                    rows = [r for r in rows if matches_where(self.metadatas[r], where)]
+            else:
+                rows = self._candidate_rows(where).tolist()
+            start = offset or 0
+            rows = rows[start: start + limit] if limit is not None else rows[start:]
+            return {
+                "ids": [self.row_ids[r] for r in rows],
+                "documents": [self.documents[r] for r in rows] if "documents" in include else None,
+                "metadatas": [self.metadatas[r] for r in rows] if "metadatas" in include else None,
+                "embeddings": (
+                    np.asarray(self.vectors[rows], dtype=np.float32).tolist()
+                    if "embeddings" in include and rows else ([] if "embeddings" in include else None)
+                ),
+            }
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, include=None) -> Dict[str, Any]:
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        queries = _normalize(query_embeddings)
+        with self._lock:
+            candidates = self._candidate_rows(where)
+            k = min(n_results, len(candidates))
+            out: Dict[str, List[List[Any]]] = {
+                "ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": [],
+            }
+            if k == 0:
+                for field in out:
+                    out[field] = [[] for _ in range(len(queries))]
+            else:
+                scores = self._score(queries, candidates)
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                for q in range(len(queries)):
+                    rows = candidates[top[q]]
+                    out["ids"].append([self.row_ids[r] for r in rows])
+                    out["documents"].append([self.documents[r] for r in rows])
+                    out["metadatas"].append([self.metadatas[r] for r in rows])
+                    out["distances"].append((2.0 - 2.0 * top_scores[q]).tolist())
+                    if "embeddings" in include:
+                        out["embeddings"].append(np.asarray(self.vectors[rows], dtype=np.float32).tolist())
+
+        return {
+            "ids": out["ids"],
+            **{field: (out[field] if field in include else None)
+               for field in ("documents", "metadatas", "distances", "embeddings")},
+        }
+
+    def _score(self, queries: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Cosine scores (num_queries, num_candidates), computed in row blocks."""
+        # candidates are sorted distinct rows below size, so equal length means all of them
+        contiguous = len(candidates) == self.size
+        scores = np.empty((len(queries), len(candidates)), dtype=np.float32)
+        for start in range(0, len(candidates), _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, len(candidates))
+            if contiguous:
+                block = self.vectors[start:end]
+            else:
+                block = self.vectors[candidates[start:end]]
+            scores[:, start:end] = queries @ np.asarray(block, dtype=np.float32).T
+        return scores
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self.vectors = None
+            if self.directory:
+                for path in (self._matrix_path, self._log_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._log = open(self._log_path, "a")
+            self._reset_state()
@@ -0,0 +1,184 @@
+"""
+app/services/ocr.py
+OCR engine for scanned documents: every frame of a multi-page image,
+DPI normalisation + binarisation before tesseract, pages OCR'd in parallel
+and results cached by image content hash.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import pytesseract
+from PIL import Image, ImageSequence
+
+from app.services.stage_executor import STAGE_CONFIG, in_pool_worker
+
+# Threads per document; 0 picks default_ocr_workers()
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+# Used when the image carries no DPI information
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "3500"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+# Optional directory for a persistent, cross-process result cache
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR") or None
+
+_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def iter_frames(image: Image.Image) -> Iterator[Image.Image]:
+    """Yields every frame (page) of a possibly multi-page image such as a TIFF."""
+    for frame in ImageSequence.Iterator(image):
+        yield frame.copy()
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    total = sum(histogram)
+    if total == 0:
+        return 127
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg = 0.0
+    weight_bg = 0
+    best_threshold, best_variance = 127, -1.0
+    for t, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = t, variance
+    return best_threshold
+
+
+def preprocess_frame(frame: Image.Image, target_dpi: int = OCR_TARGET_DPI) -> Tuple[Image.Image, int]:
+    """
+    Grayscale, downsample to target_dpi (never upsample) and binarise with an
+    Otsu threshold. Returns the processed image and the DPI it now has.
+    """
+    gray = frame.convert("L")
+    dpi_info = frame.info.get("dpi")
+    source_dpi = int(dpi_info[0]) if dpi_info and dpi_info[0] else None
+
+    scale = 1.0
+    if source_dpi and source_dpi > target_dpi:
+        scale = target_dpi / source_dpi
+    elif not source_dpi and max(gray.size) > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / max(gray.size)
+    if scale < 1.0:
+        width, height = gray.size
+        gray = gray.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+    threshold = _otsu_threshold(gray.histogram())
+    binary = gray.point([0 if p <= threshold else 255 for p in range(256)])
+
+    effective_dpi = int(source_dpi * scale) if source_dpi else target_dpi
+    return binary, effective_dpi
+
+
+def _ocr_frame(frame: Image.Image) -> str:
+    image, dpi = preprocess_frame(frame)
+    return pytesseract.image_to_string(image, lang=OCR_LANG, config=f"--dpi {dpi}")
+
+
+def _cache_key(image_bytes: bytes) -> str:
+    config = f"{OCR_TARGET_DPI}:{OCR_MAX_SIDE}:{OCR_LANG}"
+    return hashlib.sha256(config.encode() + b"\0" + image_bytes).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[List[str]]:
+    with _cache_lock:
+        pages = _cache.get(key)
+        if pages is not None:
+            _cache.move_to_end(key)
+            return pages
+    if OCR_CACHE_DIR:
+        path = os.path.join(OCR_CACHE_DIR, key + ".txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                pages = f.read().split("\f")
+            _cache_put(key, pages, persist=False)
+            return pages
+    return None
+
+
+def _cache_put(key: str, pages: List[str], persist: bool = True) -> None:
+    with _cache_lock:
+        _cache[key] = pages
+        _cache.move_to_end(key)
+        while len(_cache) > OCR_CACHE_SIZE:
+            _cache.popitem(last=False)
+    if persist and OCR_CACHE_DIR:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        # unique temp name: other processes may be caching the same image
+        fd, tmp_path = tempfile.mkstemp(prefix=key, suffix=".tmp", dir=OCR_CACHE_DIR)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write("\f".join(pages))
+            os.replace(tmp_path, os.path.join(OCR_CACHE_DIR, key + ".txt"))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def default_ocr_workers() -> int:
+    """
+    OCR_WORKERS if set, otherwise one thread per core. Inside a stage or
+    bulk-ingest pool worker the cores are shared with the pool's other
+    workers, each OCRing its own document, so each gets its share only.
+    """
+    if OCR_WORKERS > 0:
+        return OCR_WORKERS
+    cpus = os.cpu_count() or 1
+    if in_pool_worker():
+        return max(1, cpus // max(1, STAGE_CONFIG["extract"][1]))
+    return cpus
+
+
+def ocr_pages(image_bytes: bytes, workers: Optional[int] = None) -> List[str]:
+    """
+    OCRs every frame of an image file and returns one text per page.
+    image_bytes can also be an mmap of the file.
+    Tesseract runs as a subprocess, so a thread pool is enough to keep
+    several cores busy without pickling images between processes.
+    """
+    key = _cache_key(image_bytes)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    if workers is None:
+        workers = default_ocr_workers()
+
+    # mmaps are read in place; plain bytes need a file wrapper
+    image = Image.open(image_bytes if hasattr(image_bytes, "seek") else io.BytesIO(image_bytes))
+    frames = iter_frames(image)
+
+    if workers <= 1 or getattr(image, "n_frames", 1) <= 1:
+        pages = [_ocr_frame(frame) for frame in frames]
+    else:
+        # frames are decoded as workers free up: at most 2 per worker are held at once
+        pages = []
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+            for frame in frames:
+                if len(pending) >= 2 * workers:
+                    pages.append(pending.popleft().result())
+                pending.append(pool.submit(_ocr_frame, frame))
+            while pending:
+                pages.append(pending.popleft().result())
+
+    _cache_put(key, pages)
+    return pages
+
@@ -0,0 +1,215 @@
+"""
+app/services/stage_executor.py
+Bounded executors for the blocking stages of the upload pipeline.
+
+Each stage owns its own pool (a process pool for CPU-bound extraction/OCR,
+a thread pool for embedding) plus a small wait queue. The LLM stage is
+"async": the Ollama client is non-blocking, so the stage only applies the
+same admission control around the coroutine.
+
+When both the workers and the queue are full the stage refuses new work
+with StageSaturatedError instead of letting requests pile up.
+"""
+
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from app.util.instrumentation import gauge, histogram, timed
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_CPU_COUNT = os.cpu_count() or 2
+
+# name -> (kind, workers, max queued requests)
+STAGE_CONFIG = {
+    "extract": (
+        "process",
+        int(os.getenv("EXTRACT_WORKERS", str(_CPU_COUNT))),
+        int(os.getenv("EXTRACT_QUEUE", str(2 * _CPU_COUNT))),
+    ),
+    "llm": (
+        "async",
+        int(os.getenv("LLM_WORKERS", "2")),
+        int(os.getenv("LLM_QUEUE", "8")),
+    ),
+    "embed": (
+        "thread",
+        int(os.getenv("EMBED_WORKERS", "2")),
+        int(os.getenv("EMBED_QUEUE", "8")),
+    ),
+}
+
+# Set in every stage / bulk-ingest pool worker so nested page-level pools are skipped there
+POOL_WORKER_ENV = "LDS_POOL_WORKER"
+
+
+def mark_pool_worker() -> None:
+    """ProcessPoolExecutor initializer for pools whose tasks may extract PDFs."""
+    os.environ[POOL_WORKER_ENV] = "1"
+
+
+def in_pool_worker() -> bool:
+    return os.environ.get(POOL_WORKER_ENV) == "1"
+
+
+STAGE_SECONDS = histogram(
+    "stage_duration_seconds", "Time spent in a pipeline stage, including pool wait", ("stage",)
+)
+
+
+class StageSaturatedError(Exception):
+    def __init__(self, stage: str, in_flight: int, workers: int, max_queue: int):
+        self.stage = stage
+        self.in_flight = in_flight
+        self.workers = workers
+        self.max_queue = max_queue
+        super().__init__(f"Stage '{stage}' is saturated ({in_flight} in flight, limit {workers + max_queue})")
+
+    def to_detail(self) -> Dict[str, Any]:
+        return {
+            "message": f"Server busy: '{self.stage}' stage is saturated, retry later",
+            "stage": self.stage,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+        }
+
+
+class StageExecutor:
+    def __init__(self, name: str, kind: str, workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: forking a process that holds torch / tokenizer threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=mark_pool_worker,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=f"stage-{self.name}"
+                )
+            logger.info(f"Started '{self.name}' {self.kind} pool with {self.workers} workers")
+        return self._executor
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """Drops a pool whose worker died; the next run() starts a fresh one."""
+        if self._executor is executor:
+            logger.warning(f"'{self.name}' pool is broken (a worker died); replacing it")
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def check_capacity(self) -> None:
+        if self.in_flight >= self.workers + self.max_queue:
+            raise StageSaturatedError(self.name, self.in_flight, self.workers, self.max_queue)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on this stage's pool, or raises StageSaturatedError."""
+        self.check_capacity()
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs)
+            if self.kind != "process":
+                # threads see the request's timing breakdown; processes can't share it
+                call = partial(contextvars.copy_context().run, call)
+            executor = self._get_executor()
+            with timed(STAGE_SECONDS, f"stage_{self.name}", stage=self.name):
+                try:
+                    return await loop.run_in_executor(executor, call)
+                except BrokenProcessPool:
+                    # not retried: the request that killed the worker would likely kill it again
+                    self._discard_executor(executor)
+                    raise
+        finally:
+            self.in_flight -= 1
+
+    async def run_in_thread(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs fn on a plain thread under this stage's admission limit, for work
+        that fans out to its own process pool (large PDFs) and so must not
+        run inside one of this stage's workers.
+        """
+        self.check_capacity()
+        self.in_flight += 1
+        try:
+            call = partial(contextvars.copy_context().run, partial(fn, *args, **kwargs))
+            with timed(STAGE_SECONDS, f"stage_{self.name}", stage=self.name):
+                return await asyncio.to_thread(call)
+        finally:
+            self.in_flight -= 1
+
+    async def run_async(self, coro_fn: Callable, *args, **kwargs) -> Any:
+        """Awaits coro_fn(*args, **kwargs) under this stage's admission limit."""
+        self.check_capacity()
+        self.in_flight += 1
+        try:
+            with timed(STAGE_SECONDS, f"stage_{self.name}", stage=self.name):
+                return await coro_fn(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+
+_stages: Dict[str, StageExecutor] = {}
+
+
+def get_stage(name: str) -> StageExecutor:
+    stage = _stages.get(name)
+    if stage is None:
+        kind, workers, max_queue = STAGE_CONFIG[name]
+        stage = StageExecutor(name, kind, workers, max_queue)
+        _stages[name] = stage
+    return stage
+
+
+def stage_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: stage.stats() for name, stage in _stages.items()}
+
+
+gauge(
+    "stage_in_flight", "Requests running or queued per stage",
+    lambda: {(name,): stage.in_flight for name, stage in _stages.items()}, ("stage",),
+)
+gauge(
+    "stage_queue_depth", "Requests waiting for a worker per stage",
+    lambda: {(name,): stage.queue_depth for name, stage in _stages.items()}, ("stage",),
+)
+
+
+def shutdown_stages() -> None:
+    for stage in _stages.values():
+        stage.shutdown()
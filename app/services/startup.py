@@ -0,0 +1,99 @@
+"""
+app/services/startup.py
+Readiness tracking and optional background warmup of heavy resources.
+
+Nothing heavy is loaded at import time: the tokenizer, the sentence splitter,
+the embedding model and the vector store are all created lazily by their
+getters. With STARTUP_WARMUP enabled (the default) the app's startup hook
+runs those getters once on a background thread, plus a dummy encode, so the
+first real request does not pay for them. /ready answers 503 until every
+warmup step has finished.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.doc_registry import get_doc_registry
+from app.services.ingest_document import TOKENIZER_NAME
+from app.services.summary_store import get_summary_store
+from app.services.vector_store import get_vector_store
+from app.util.chunker import get_sentence_splitter, get_tokenizer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1").lower() in ("1", "true", "yes")
+
+
+class StartupManager:
+    def __init__(self, warmup: bool = STARTUP_WARMUP):
+        self.warmup = warmup
+        self._steps: List[Tuple[str, Callable[[], Any]]] = []
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, fn: Callable[[], Any]) -> None:
+        self._steps.append((name, fn))
+        self.components[name] = {"status": "pending" if self.warmup else "lazy"}
+
+    def start(self) -> None:
+        """Starts the warmup thread (once). Does nothing when warmup is disabled."""
+        if not self.warmup:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="startup-warmup", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        for name, fn in self._steps:
+            self.components[name] = {"status": "loading"}
+            step_started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                logger.exception(f"Warmup step '{name}' failed")
+                self.components[name] = {"status": "failed", "error": str(e)}
+                continue
+            self.components[name] = {
+                "status": "ready",
+                "seconds": round(time.perf_counter() - step_started, 3),
+            }
+        logger.info(f"Warmup finished in {time.perf_counter() - started:.1f}s")
+
+    @property
+    def ready(self) -> bool:
+        if not self.warmup:
+            return True
+        return all(c["status"] == "ready" for c in self.components.values())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup": self.warmup,
+            "components": {name: dict(c) for name, c in self.components.items()},
+        }
+
+
+_manager: Optional[StartupManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_startup_manager() -> StartupManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = StartupManager()
+                manager.register("tokenizer", lambda: get_tokenizer(TOKENIZER_NAME))
+                manager.register("sentence_splitter", get_sentence_splitter)
+                manager.register("stores", lambda: (get_doc_registry(), get_summary_store()))
+                manager.register("vector_store", get_vector_store)
+                manager.register("embedding_model", lambda: get_vector_store().warmup())
+                _manager = manager
+    return _manager
@@ -1,38 +1,47 @@
-import requests
-import json
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, List
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "mistral"
+from app.services.llm_client import LLM_MODEL_NAME, get_llm_client
+from app.util.chunker import get_tokenizer, smart_chunker
 
+MODEL_NAME = LLM_MODEL_NAME
 
-def query_ollama(prompt: str, max_tokens: int = 256) -> str:
-    try:
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "options": {
-                "temperature": 0.2,
-                "num_predict": max_tokens
-            }
-        }
+# Bump whenever build_summary_prompt / build_merge_prompt change
+SUMMARY_PROMPT_VERSION = "v1"
 
-        response = requests.post(OLLAMA_URL, json=payload, timeout=120)
+# Map-reduce settings (token counts use the chunking tokenizer)
+SUMMARY_DIRECT_MAX_TOKENS = int(os.getenv("SUMMARY_DIRECT_MAX_TOKENS", "2000"))
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "1500"))
+# Below 2 a merge level never shrinks, so the reduce loop would not end
+SUMMARY_MERGE_FANIN = max(2, int(os.getenv("SUMMARY_MERGE_FANIN", "6")))
+SUMMARY_MAX_PARALLEL = int(os.getenv("SUMMARY_MAX_PARALLEL", "4"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1024"))
 
-        if response.headers.get("Content-Type") == "application/x-ndjson":
-            result_text = ""
-            for line in response.iter_lines():
-                if line:
-                    data = json.loads(line.decode())
-                    if "response" in data:
-                        result_text += data["response"]
-            return result_text.strip()
+# prompt hash -> generated summary, for section and merge calls. Shared by
+# the API event loop and bulk ingest's summarize thread, hence the lock.
+_partial_cache: "OrderedDict[str, str]" = OrderedDict()
+_partial_cache_lock = threading.Lock()
 
-        data = response.json()
-        return data.get("response", "").strip()
 
-    except Exception as e:
-        print("[Ollama ERROR]:", e)
-        return "AI could not generate a response."
+async def query_ollama(prompt: str, max_tokens: int = 256) -> str:
+    """
+    Returns the model's completion for prompt through the shared pooled client.
+    Raises LLMError subclasses (timeout / unavailable / bad response) on failure.
+    """
+    return await get_llm_client().generate(prompt, max_tokens=max_tokens)
+
+
+async def stream_ollama(prompt: str, max_tokens: int = 256) -> AsyncIterator[str]:
+    """
+    Yields response tokens as Ollama produces them (NDJSON streaming).
+    Errors are raised to the caller instead of being turned into a message.
+    """
+    async for token in get_llm_client().stream(prompt, max_tokens=max_tokens):
+        yield token
 
 
 def build_summary_prompt(text: str) -> str:
@@ -55,6 +64,84 @@ SUMMARY:
 """
 
 
-def generate_summary(text: str, max_tokens: int = 256) -> str:
-    return query_ollama(text, max_tokens=max_tokens)
+def build_merge_prompt(summaries: List[str]) -> str:
+    sections = "\n\n".join(
+        f"[SECTION {i+1}]\n{summary}" for i, summary in enumerate(summaries)
+    )
+    return f"""
+The following are summaries of consecutive sections of one legal document.
+Merge them into a single summary of the whole document with focus on:
+- Purpose of the agreement
+- Parties involved
+- Obligations and responsibilities
+- Payment terms
+- Risks / penalties
+- Termination conditions
+- Important dates
+
+Remove repetition. Keep every distinct fact. Be precise. No hallucinations.
+
+SECTION SUMMARIES:
+{sections}
+
+SUMMARY:
+"""
+
+
+async def _cached_query(prompt: str, max_tokens: int) -> str:
+    key = hashlib.sha256(f"{MODEL_NAME}:{max_tokens}:{prompt}".encode("utf-8")).hexdigest()
+    with _partial_cache_lock:
+        cached = _partial_cache.get(key)
+        if cached is not None:
+            _partial_cache.move_to_end(key)
+            return cached
+
+    summary = await query_ollama(prompt, max_tokens=max_tokens)
+    with _partial_cache_lock:
+        _partial_cache[key] = summary
+        while len(_partial_cache) > SUMMARY_CACHE_SIZE:
+            _partial_cache.popitem(last=False)
+    return summary
+
+
+def _split_sections(text: str) -> List[str]:
+    tokenizer = get_tokenizer()
+    if len(tokenizer.encode(text, add_special_tokens=False)) <= SUMMARY_DIRECT_MAX_TOKENS:
+        return [text]
+    return smart_chunker(text, tokenizer=tokenizer, max_tokens=SUMMARY_SECTION_TOKENS, overlap=0)
+
+
+async def generate_summary(text: str, max_tokens: int = 256) -> str:
+    """
+    Map-reduce summarization.
+    Short documents are summarized in one call. Longer ones are split into
+    sections with the chunker, each section is summarized concurrently
+    (at most SUMMARY_MAX_PARALLEL at once), and the section summaries are
+    merged SUMMARY_MERGE_FANIN at a time until one summary is left, so the
+    number of merge levels grows with document length. Section and merge
+    results are cached by prompt hash, so retries only redo failed calls.
+    """
+    if not text or not text.strip():
+        return ""
+
+    # tokenization is CPU-bound; keep it off the event loop
+    sections = await asyncio.to_thread(_split_sections, text)
+    if len(sections) == 1:
+        return await _cached_query(build_summary_prompt(sections[0]), max_tokens)
+
+    limit = asyncio.Semaphore(SUMMARY_MAX_PARALLEL)
+
+    async def bounded(prompt: str) -> str:
+        async with limit:
+            return await _cached_query(prompt, max_tokens)
+
+    async def merge(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        return await bounded(build_merge_prompt(group))
 
+    level = await asyncio.gather(*[bounded(build_summary_prompt(s)) for s in sections])
+    while len(level) > 1:
+        groups = [level[i : i + SUMMARY_MERGE_FANIN] for i in range(0, len(level), SUMMARY_MERGE_FANIN)]
+        level = await asyncio.gather(*[merge(group) for group in groups])
+    return level[0]
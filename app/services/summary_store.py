@@ -0,0 +1,173 @@
+"""
+app/services/summary_store.py
+Persistent summary cache (SQLite) keyed by the SHA-256 of the cleaned text,
+the LLM model name and the summary prompt version.
+
+A second table maps doc_id -> cache key so the latest summary of a document
+can be fetched by id. Entries are evicted least-recently-used once the
+stored summaries exceed SUMMARY_STORE_MAX_BYTES.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from app.services.summarizer import MODEL_NAME, SUMMARY_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SUMMARY_STORE_PATH = os.getenv("SUMMARY_STORE_PATH", "./summary_store.db")
+SUMMARY_STORE_MAX_BYTES = int(os.getenv("SUMMARY_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS summaries_last_access ON summaries (last_access);
+CREATE TABLE IF NOT EXISTS doc_summaries (
+    doc_id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def hash_text(cleaned_text: str) -> str:
+    return hashlib.sha256(cleaned_text.encode("utf-8")).hexdigest()
+
+
+class SummaryStore:
+    def __init__(self, path: str = SUMMARY_STORE_PATH, max_bytes: int = SUMMARY_STORE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # one short-lived connection per call: safe across threads and worker processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(text_hash: str, model: str, prompt_version: str) -> str:
+        return f"{model}:{prompt_version}:{text_hash}"
+
+    def get(
+        self,
+        text_hash: str,
+        model: str = MODEL_NAME,
+        prompt_version: str = SUMMARY_PROMPT_VERSION,
+    ) -> Optional[str]:
+        key = self.make_key(text_hash, model, prompt_version)
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(
+        self,
+        text_hash: str,
+        summary: str,
+        doc_id: Optional[str] = None,
+        model: str = MODEL_NAME,
+        prompt_version: str = SUMMARY_PROMPT_VERSION,
+    ) -> None:
+        key = self.make_key(text_hash, model, prompt_version)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries "
+                "(key, text_hash, model, prompt_version, summary, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, text_hash, model, prompt_version, summary, len(summary.encode("utf-8")), now, now),
+            )
+            if doc_id:
+                self._link(conn, doc_id, key, now)
+            self._evict(conn)
+
+    def link_document(
+        self,
+        doc_id: str,
+        text_hash: str,
+        model: str = MODEL_NAME,
+        prompt_version: str = SUMMARY_PROMPT_VERSION,
+    ) -> None:
+        with self._connect() as conn:
+            self._link(conn, doc_id, self.make_key(text_hash, model, prompt_version), time.time())
+
+    @staticmethod
+    def _link(conn: sqlite3.Connection, doc_id: str, key: str, now: float) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO doc_summaries (doc_id, key, updated_at) VALUES (?, ?, ?)",
+            (doc_id, key, now),
+        )
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM summaries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        conn.execute("DELETE FROM doc_summaries WHERE key NOT IN (SELECT key FROM summaries)")
+        logger.info(f"Evicted {removed} cached summaries")
+
+    def get_by_doc_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT s.summary, s.model, s.prompt_version, s.text_hash, s.created_at "
+                "FROM doc_summaries d JOIN summaries s ON s.key = d.key WHERE d.doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        summary, model, prompt_version, text_hash, created_at = row
+        return {
+            "doc_id": doc_id,
+            "summary": summary,
+            "model": model,
+            "prompt_version": prompt_version,
+            "text_hash": text_hash,
+            "created_at": created_at,
+        }
+
+
+_store: Optional[SummaryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_summary_store() -> SummaryStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SummaryStore()
+    return _store
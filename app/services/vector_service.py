@@ -0,0 +1,496 @@
+"""
+app/services/vector_service.py
+Shared embedding/vector service for multi-worker deployments.
+
+One service process owns the embedding model and the vector store; API
+workers started with VECTOR_SERVICE_ADDRESS get a RemoteVectorStore from
+get_vector_store() and talk to it over multiprocessing.connection (a Unix
+socket or a localhost TCP port). Model memory is paid once, however many
+uvicorn workers run.
+
+In the service:
+- writes run one at a time on a single writer thread, so the Chroma
+  directory only ever has one writer
+- queries arriving within VECTOR_SERVICE_BATCH_WAIT_MS of each other (from
+  any worker) with the same parameters are embedded and searched together
+  in one query_many call; batches with different parameters run side by
+  side on VECTOR_SERVICE_QUERY_WORKERS threads
+- other reads (chunk listings, stats, embeddings) run on the connection's
+  own thread
+
+Run it before the API workers:
+
+    python -m app.services.vector_service --address unix:/tmp/legal_doc_vectors.sock
+    VECTOR_SERVICE_ADDRESS=unix:/tmp/legal_doc_vectors.sock uvicorn app.main:app --workers 4
+
+TCP addresses ("127.0.0.1:7070") require VECTOR_SERVICE_AUTHKEY on both
+sides, since requests are pickled.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.embedding_backends import EMBEDDING_BACKEND, embedding_cache_name
+from app.services.vector_store import (
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_EMBEDDING_MODEL,
+    DEFAULT_PERSIST_DIRECTORY,
+    VECTOR_INDEX_BACKEND,
+    VECTOR_SERVICE_ADDRESS,
+    get_local_vector_store,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_SERVICE_ADDRESS = "unix:/tmp/legal_doc_vectors.sock"
+VECTOR_SERVICE_AUTHKEY = os.getenv("VECTOR_SERVICE_AUTHKEY") or None
+# How long the batcher waits for more queries after the first one arrives
+VECTOR_SERVICE_BATCH_WAIT_MS = float(os.getenv("VECTOR_SERVICE_BATCH_WAIT_MS", "2"))
+VECTOR_SERVICE_MAX_BATCH = int(os.getenv("VECTOR_SERVICE_MAX_BATCH", "64"))
+VECTOR_SERVICE_QUERY_WORKERS = int(os.getenv("VECTOR_SERVICE_QUERY_WORKERS", "4"))
+# How long a client waits for the reply to one call before giving up on it
+VECTOR_SERVICE_TIMEOUT = float(os.getenv("VECTOR_SERVICE_TIMEOUT", "300"))
+# How long a worker's warmup waits for the service to come up
+VECTOR_SERVICE_CONNECT_TIMEOUT = float(os.getenv("VECTOR_SERVICE_CONNECT_TIMEOUT", "120"))
+
+WRITE_METHODS = {
+    "add_documents",
+    "upsert_documents",
+    "write_embeddings",
+    "update_metadatas",
+    "delete_by_id",
+    "reset_collection",
+}
+READ_METHODS = {"embed_texts", "get_document_chunks", "get_collection_stats", "warmup"}
+# Raw collection calls, for DocRegistry.rebuild
+COLLECTION_METHODS = {"get", "count"}
+STORE_KEYS = ("collection_name", "embedding_model_name", "embedding_backend", "index_backend")
+
+
+class VectorServiceError(RuntimeError):
+    pass
+
+
+def parse_address(address: str) -> Tuple[Any, str]:
+    """"unix:/path.sock" -> (path, "AF_UNIX"); "host:port" -> ((host, port), "AF_INET")."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):], "AF_UNIX"
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid vector service address '{address}' (use unix:/path or host:port)")
+    return (host, int(port)), "AF_INET"
+
+
+def _authkey(family: str, authkey: Optional[str]) -> Optional[bytes]:
+    if family == "AF_INET" and not authkey:
+        raise ValueError("VECTOR_SERVICE_AUTHKEY must be set for TCP vector service addresses")
+    return authkey.encode() if authkey else None
+
+
+# ---------------------------------------------------------------------------
+# SERVICE
+# ---------------------------------------------------------------------------
+
+class QueryBatcher:
+    """
+    Coalesces query_many calls. The first queued request opens a batch that
+    stays open for wait_seconds or until max_batch texts; requests in it are
+    grouped by (store, parameters) and each group runs as one call on a
+    small thread pool, so a slow group doesn't hold up the others.
+    """
+
+    def __init__(
+        self,
+        wait_seconds: float = VECTOR_SERVICE_BATCH_WAIT_MS / 1000.0,
+        max_batch: int = VECTOR_SERVICE_MAX_BATCH,
+        workers: int = VECTOR_SERVICE_QUERY_WORKERS,
+    ):
+        self.wait_seconds = wait_seconds
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="vector-query")
+        threading.Thread(target=self._loop, name="vector-query-batcher", daemon=True).start()
+
+    def submit(self, store, texts: List[str], params: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        key = (id(store), json.dumps(params, sort_keys=True, default=str))
+        self._queue.put((key, store, texts, params, future))
+        return future
+
+    def _collect(self) -> List[tuple]:
+        pending = [self._queue.get()]
+        size = len(pending[0][2])
+        deadline = time.monotonic() + self.wait_seconds
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[2])
+        return pending
+
+    def _loop(self) -> None:
+        while True:
+            groups: Dict[tuple, List[tuple]] = {}
+            for item in self._collect():
+                groups.setdefault(item[0], []).append(item)
+            for items in groups.values():
+                self.batches += 1
+                self.queries += sum(len(item[2]) for item in items)
+                self._pool.submit(self._run_group, items)
+
+    @staticmethod
+    def _run_group(items: List[tuple]) -> None:
+        _, store, _, params, _ = items[0]
+        texts = [t for item in items for t in item[2]]
+        try:
+            results = store.query_many(texts, **params)
+        except Exception as e:
+            for item in items:
+                item[4].set_exception(e)
+            return
+        pos = 0
+        for item in items:
+            item[4].set_result(results[pos : pos + len(item[2])])
+            pos += len(item[2])
+
+
+class VectorService:
+    def __init__(
+        self,
+        address: str = DEFAULT_SERVICE_ADDRESS,
+        authkey: Optional[str] = VECTOR_SERVICE_AUTHKEY,
+        persist_directory: Optional[str] = DEFAULT_PERSIST_DIRECTORY,
+    ):
+        self.address, self.family = parse_address(address)
+        self.authkey = _authkey(self.family, authkey)
+        self.persist_directory = persist_directory
+        self.batcher = QueryBatcher()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-writer")
+        self._listener: Optional[Listener] = None
+
+    def _store(self, store_kwargs: Dict[str, Any]):
+        unknown = set(store_kwargs) - set(STORE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown store settings: {sorted(unknown)}")
+        return get_local_vector_store(persist_directory=self.persist_directory, **store_kwargs)
+
+    def handle(self, store_kwargs: Dict[str, Any], method: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        store = self._store(store_kwargs)
+        if method == "query_many":
+            return self.batcher.submit(store, list(args[0]), kwargs).result()
+        if method in WRITE_METHODS:
+            return self._writer.submit(getattr(store, method), *args, **kwargs).result()
+        if method in READ_METHODS:
+            return getattr(store, method)(*args, **kwargs)
+        if method in COLLECTION_METHODS:
+            return getattr(store.collection, method)(*args, **kwargs)
+        if method == "service_stats":
+            return {"query_batches": self.batcher.batches, "queries": self.batcher.queries}
+        raise ValueError(f"Unknown vector service method '{method}'")
+
+    def _serve_connection(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    store_kwargs, method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self.handle(store_kwargs, method, args, kwargs))
+                except Exception as e:
+                    if not isinstance(e, ValueError):
+                        logger.exception(f"Vector service call '{method}' failed")
+                    reply = ("error", type(e).__name__, str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self) -> None:
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            # left behind by a previous run
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family=self.family, authkey=self.authkey)
+        if self.family == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        logger.info(f"Vector service listening on {self.address}")
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except Exception as e:
+                    # e.g. a client with the wrong authkey
+                    logger.warning(f"Rejected vector service connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self._writer.shutdown(wait=True)
+
+
+# ---------------------------------------------------------------------------
+# CLIENT
+# ---------------------------------------------------------------------------
+
+class _RemoteCollection:
+    """The collection calls DocRegistry.rebuild needs, forwarded to the service."""
+
+    def __init__(self, store: "RemoteVectorStore"):
+        self._store = store
+
+    def get(self, **kwargs) -> Dict[str, Any]:
+        return self._store._call("get", **kwargs)
+
+    def count(self) -> int:
+        return self._store._call("count")
+
+
+class RemoteVectorStore:
+    """
+    VectorStore API backed by the vector service. Connections are pooled, so
+    the store can be shared by threads like a local one; embedding and query
+    caches live in the service and are shared by every worker.
+    """
+
+    def __init__(
+        self,
+        address: str = VECTOR_SERVICE_ADDRESS or DEFAULT_SERVICE_ADDRESS,
+        authkey: Optional[str] = VECTOR_SERVICE_AUTHKEY,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+        embedding_backend: str = EMBEDDING_BACKEND,
+        index_backend: str = VECTOR_INDEX_BACKEND,
+        timeout: float = VECTOR_SERVICE_TIMEOUT,
+    ):
+        self.address, self.family = parse_address(address)
+        self.authkey = _authkey(self.family, authkey)
+        self.timeout = timeout
+        self.collection_name = collection_name
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_cache_name = embedding_cache_name(embedding_model_name, embedding_backend)
+        self.index_backend = index_backend
+        self.collection = _RemoteCollection(self)
+        self._store_kwargs = {
+            "collection_name": collection_name,
+            "embedding_model_name": embedding_model_name,
+            "embedding_backend": embedding_backend,
+            "index_backend": index_backend,
+        }
+        self._idle: List[Connection] = []
+        self._idle_lock = threading.Lock()
+
+    def _connect(self) -> Connection:
+        try:
+            return Client(self.address, family=self.family, authkey=self.authkey)
+        except OSError as e:
+            raise VectorServiceError(f"Vector service at {self.address} unavailable: {e}")
+
+    def _acquire(self) -> Tuple[Connection, bool]:
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn: Connection) -> None:
+        with self._idle_lock:
+            self._idle.append(conn)
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        while True:
+            conn, reused = self._acquire()
+            sent = False
+            try:
+                conn.send((self._store_kwargs, method, args, kwargs))
+                sent = True
+                if not conn.poll(self.timeout):
+                    # a late reply would answer the next call on this connection
+                    conn.close()
+                    raise VectorServiceError(
+                        f"Vector service at {self.address} did not answer '{method}' within {self.timeout:g}s"
+                    )
+                reply = conn.recv()
+            except (EOFError, OSError) as e:
+                conn.close()
+                # a pooled connection from before a service restart is dropped
+                # and the call retried, unless a write may already have applied
+                if reused and (not sent or method not in WRITE_METHODS):
+                    continue
+                raise VectorServiceError(f"Vector service at {self.address} failed during '{method}': {e}")
+            self._release(conn)
+            break
+
+        if reply[0] == "ok":
+            return reply[1]
+        _, kind, message = reply
+        if kind == "ValueError":
+            raise ValueError(message)
+        raise VectorServiceError(f"{kind}: {message}")
+
+    def warmup(self, timeout: float = VECTOR_SERVICE_CONNECT_TIMEOUT) -> None:
+        """Waits for the service to accept connections, then has it load the model."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._call("warmup")
+                return
+            except VectorServiceError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(1.0)
+
+    def embed_texts(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        return self._call("embed_texts", texts, batch_size=batch_size)
+
+    def add_documents(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: int = 64,
+    ) -> None:
+        self._call("add_documents", ids, documents, metadatas, batch_size=batch_size)
+
+    def upsert_documents(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: int = 64,
+    ) -> None:
+        self._call("upsert_documents", ids, documents, metadatas, batch_size=batch_size)
+
+    def query(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        include: Optional[List[str]] = None,
+        use_cache: bool = True,
+        doc_ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return self.query_many(
+            [query_text],
+            top_k=top_k,
+            include=include,
+            use_cache=use_cache,
+            doc_ids=doc_ids,
+            where=where,
+        )[0]
+
+    def query_many(
+        self,
+        query_texts: List[str],
+        top_k: int = 5,
+        include: Optional[List[str]] = None,
+        use_cache: bool = True,
+        doc_ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        return self._call(
+            "query_many",
+            list(query_texts),
+            top_k=top_k,
+            include=include,
+            use_cache=use_cache,
+            doc_ids=doc_ids,
+            where=where,
+        )
+
+    def write_embeddings(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+    ) -> None:
+        self._call("write_embeddings", ids, documents, metadatas, embeddings)
+
+    def get_document_chunks(self, doc_id: str, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return self._call("get_document_chunks", doc_id, include=include)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        self._call("update_metadatas", ids, metadatas)
+
+    def delete_by_id(self, ids: List[str]) -> None:
+        self._call("delete_by_id", ids)
+
+    def reset_collection(self) -> None:
+        self._call("reset_collection")
+
+    def get_collection_stats(self) -> Dict[str, Any]:
+        stats = self._call("get_collection_stats")
+        stats["vector_service"] = {"address": str(self.address), **self._call("service_stats")}
+        return stats
+
+    def add_single(self, id_: str, document: str, metadata: Optional[Dict[str, Any]] = None):
+        self.add_documents([id_], [document], [metadata or {}])
+
+
+_remote_stores: Dict[tuple, RemoteVectorStore] = {}
+_remote_lock = threading.Lock()
+
+
+def get_remote_vector_store(
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_backend: str = EMBEDDING_BACKEND,
+    index_backend: str = VECTOR_INDEX_BACKEND,
+) -> RemoteVectorStore:
+    key = (collection_name, embedding_model_name, embedding_backend, index_backend)
+    store = _remote_stores.get(key)
+    if store is None:
+        with _remote_lock:
+            store = _remote_stores.get(key)
+            if store is None:
+                store = RemoteVectorStore(
+                    collection_name=collection_name,
+                    embedding_model_name=embedding_model_name,
+                    embedding_backend=embedding_backend,
+                    index_backend=index_backend,
+                )
+                _remote_stores[key] = store
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared embedding/vector store service")
+    parser.add_argument("--address", default=VECTOR_SERVICE_ADDRESS or DEFAULT_SERVICE_ADDRESS,
+                        help="unix:/path/to.sock or host:port")
+    parser.add_argument("--persist-directory", default=DEFAULT_PERSIST_DIRECTORY)
+    parser.add_argument("--no-warmup", action="store_true", help="load the model on first use instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = VectorService(address=args.address, persist_directory=args.persist_directory)
+    if not args.no_warmup:
+        service.handle({}, "warmup", (), {})
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,321 @@
+import json
 import os
 import threading
 from typing import List, Dict, Optional, Any
 import logging
 
-from chromadb import PersistentClient, EphemeralClient
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from app.services.embedding_backends import (
+    EMBEDDING_BACKEND,
+    EmbeddingBackend,
+    embedding_cache_name,
+    load_backend,
+)
+from app.services.embedding_cache import EmbeddingCache, get_embedding_cache
+from app.services.numpy_index import NumpyCollection
+from app.services.query_cache import QueryResultCache
+from app.util.instrumentation import EMBED_BATCH_SIZE, EMBED_SECONDS, VECTOR_DB_SECONDS, timed
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+DEFAULT_COLLECTION_NAME = "legal_docs"
+DEFAULT_PERSIST_DIRECTORY = "./chroma_db"
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "chroma" (HNSW, default) or "numpy" (exact search, see numpy_index.py)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")
+# When set, get_vector_store returns a client of the shared vector service
+# (see vector_service.py) instead of loading the model and store in-process
+VECTOR_SERVICE_ADDRESS = os.getenv("VECTOR_SERVICE_ADDRESS") or None
 
-class VectorStore:
-    def __init__(
-        self,
-        collection_name: str = "legal_docs",
-        persist_directory: Optional[str] = "./chroma_db",
-        embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-        allow_reset: bool = False,
-    ):
-        self.collection_name = collection_name
-        self.persist_directory = persist_directory
-        self.embedding_model_name = embedding_model_name
-        self._lock = threading.Lock()
-        self._embed_model: Optional[SentenceTransformer] = None
+# PROCESS-WIDE REGISTRIES
+# One embedding model per (model name, backend), one Chroma client per persist
+# directory, one NumPy index per (persist directory, collection) and one
+# VectorStore per (collection, persist directory, model, backend, index backend) key.
+# Re-entrant: get_vector_store() holds it while VectorStore() calls _get_client().
+_registry_lock = threading.RLock()
+_embedding_models: Dict[tuple, EmbeddingBackend] = {}
+_model_locks: Dict[tuple, threading.Lock] = {}
+_clients: Dict[Optional[str], Any] = {}
+_numpy_collections: Dict[tuple, NumpyCollection] = {}
+_stores: Dict[tuple, "VectorStore"] = {}
+
+
+def get_embedding_model(
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    backend: str = EMBEDDING_BACKEND,
+) -> EmbeddingBackend:
+    """
+    Returns the shared embedding backend for (model_name, backend), loading it on first use.
+    Concurrent callers for the same model block on a per-model lock so the
+    weights are only ever loaded once per process.
+    """
+    key = (model_name, backend)
+    model = _embedding_models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(key, threading.Lock())
+
+    with model_lock:
+        model = _embedding_models.get(key)
+        if model is None:
+            try:
+                model = load_backend(model_name, backend)
+            except Exception:
+                logger.exception("Failed to load embedding model")
+                raise
+            _embedding_models[key] = model
+    return model
+
+
+def _get_client(persist_directory: Optional[str]):
+    """Returns the shared Chroma client for a persist directory (None = in-memory)."""
+    key = os.path.abspath(persist_directory) if persist_directory else None
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        # chromadb is imported on first use so importing the app stays cheap
+        from chromadb import EphemeralClient, PersistentClient
 
         try:
             if persist_directory:
                 os.makedirs(persist_directory, exist_ok=True)
-                self.client = PersistentClient(path=persist_directory)
+                client = PersistentClient(path=persist_directory)
                 logger.info(f"Chroma PersistentClient initialized at {persist_directory}")
             else:
-                self.client = EphemeralClient()
+                client = EphemeralClient()
                 logger.info("Chroma EphemeralClient initialized (in-memory)")
         except Exception:
             logger.exception("Failed to initialize Chroma client")
             raise
+        _clients[key] = client
+        return client
+
+
+def _get_numpy_collection(persist_directory: Optional[str], collection_name: str) -> NumpyCollection:
+    """Returns the shared NumPy index for a collection (None directory = in-memory)."""
+    key = (os.path.abspath(persist_directory) if persist_directory else None, collection_name)
+    with _registry_lock:
+        collection = _numpy_collections.get(key)
+        if collection is None:
+            directory = os.path.join(persist_directory, "numpy_index") if persist_directory else None
+            collection = NumpyCollection(collection_name, directory=directory)
+            _numpy_collections[key] = collection
+        return collection
+
+
+def get_vector_store(
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_directory: Optional[str] = DEFAULT_PERSIST_DIRECTORY,
+    embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_backend: str = EMBEDDING_BACKEND,
+    index_backend: str = VECTOR_INDEX_BACKEND,
+):
+    """
+    Returns the process-wide VectorStore for (collection, persist directory, model,
+    embedding backend, index backend).
+    The store is created on first call; routers and services should use this
+    instead of constructing VectorStore directly. With VECTOR_SERVICE_ADDRESS
+    set, the returned object is a RemoteVectorStore with the same API; the
+    service process decides the persist directory.
+    """
+    if VECTOR_SERVICE_ADDRESS:
+        from app.services.vector_service import get_remote_vector_store
 
+        return get_remote_vector_store(
+            collection_name=collection_name,
+            embedding_model_name=embedding_model_name,
+            embedding_backend=embedding_backend,
+            index_backend=index_backend,
+        )
+    return get_local_vector_store(
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedding_model_name=embedding_model_name,
+        embedding_backend=embedding_backend,
+        index_backend=index_backend,
+    )
+
+
+def get_local_vector_store(
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_directory: Optional[str] = DEFAULT_PERSIST_DIRECTORY,
+    embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+    embedding_backend: str = EMBEDDING_BACKEND,
+    index_backend: str = VECTOR_INDEX_BACKEND,
+) -> "VectorStore":
+    """get_vector_store without the service indirection; used by the service process itself."""
+    key = (
+        collection_name,
+        os.path.abspath(persist_directory) if persist_directory else None,
+        embedding_model_name,
+        embedding_backend,
+        index_backend,
+    )
+    store = _stores.get(key)
+    if store is not None:
+        return store
+
+    with _registry_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = VectorStore(
+                collection_name=collection_name,
+                persist_directory=persist_directory,
+                embedding_model_name=embedding_model_name,
+                embedding_backend=embedding_backend,
+                index_backend=index_backend,
+            )
+            _stores[key] = store
+    return store
+
+
+WHERE_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin"}
+_WHERE_SCALARS = (str, int, float, bool)
+
+
+def validate_where(where: Any, path: str = "where") -> None:
+    """
+    Raises ValueError unless where is a metadata filter Chroma accepts: one
+    key per dict, either $and/$or over two or more filters or a field name
+    mapped to a scalar or to a single {operator: operand}.
+    """
+    if not isinstance(where, dict) or len(where) != 1:
+        raise ValueError(f"{path} must be an object with exactly one key")
+    key, value = next(iter(where.items()))
+    if key in ("$and", "$or"):
+        if not isinstance(value, list) or len(value) < 2:
+            raise ValueError(f"{path}.{key} must be a list of at least two filters")
+        for i, clause in enumerate(value):
+            validate_where(clause, f"{path}.{key}[{i}]")
+        return
+    if key.startswith("$"):
+        raise ValueError(f"{path}: unsupported operator '{key}' (use $and or $or at this level)")
+    if isinstance(value, _WHERE_SCALARS):
+        return
+    if not isinstance(value, dict) or len(value) != 1:
+        raise ValueError(f"{path}.{key} must be a scalar or an object with exactly one operator")
+    op, operand = next(iter(value.items()))
+    if op not in WHERE_OPERATORS:
+        raise ValueError(f"{path}.{key}: unsupported operator '{op}' (use {', '.join(sorted(WHERE_OPERATORS))})")
+    if op in ("$in", "$nin"):
+        if not isinstance(operand, list) or not operand or not all(isinstance(v, _WHERE_SCALARS) for v in operand):
+            raise ValueError(f"{path}.{key}.{op} must be a non-empty list of scalars")
+    elif op in ("$gt", "$gte", "$lt", "$lte"):
+        if isinstance(operand, bool) or not isinstance(operand, (int, float)):
+            raise ValueError(f"{path}.{key}.{op} must be a number")
+    elif not isinstance(operand, _WHERE_SCALARS):
+        raise ValueError(f"{path}.{key}.{op} must be a scalar")
+
+
+def build_where(
+    doc_ids: Optional[List[str]] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Combines a doc_id scope and an arbitrary metadata filter into one Chroma
+    where clause. A malformed filter raises ValueError.
+    """
+    if where:
+        validate_where(where)
+    clauses = []
+    if doc_ids:
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if len(doc_ids) == 1:
+            clauses.append({"doc_id": doc_ids[0]})
+        else:
+            clauses.append({"doc_id": {"$in": doc_ids}})
+    if where:
+        clauses.append(where)
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class VectorStore:
+    def __init__(
+        self,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        persist_directory: Optional[str] = DEFAULT_PERSIST_DIRECTORY,
+        embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+        embedding_backend: str = EMBEDDING_BACKEND,
+        index_backend: str = VECTOR_INDEX_BACKEND,
+        allow_reset: bool = False,
+    ):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_cache_name = embedding_cache_name(embedding_model_name, embedding_backend)
+        self.index_backend = index_backend
+        self._lock = threading.Lock()
+        self._embed_model: Optional[EmbeddingBackend] = None
+        self.embedding_cache: EmbeddingCache = get_embedding_cache()
+        self.query_cache = QueryResultCache()
+        # Bumped on every write; part of every query cache key
+        self.generation = 0
+
+        if index_backend == "numpy":
+            self.client = None
+            self.collection = _get_numpy_collection(persist_directory, collection_name)
+            if allow_reset:
+                logger.warning(f"Resetting existing collection '{collection_name}'")
+                self.collection.reset()
+            logger.info(f"Using NumPy index: '{collection_name}'")
+        elif index_backend == "chroma":
+            self.client = _get_client(persist_directory)
+            self.collection = self._open_chroma_collection(allow_reset)
+        else:
+            raise ValueError(f"Unknown index backend '{index_backend}' (choose from chroma, numpy)")
+
+    def _open_chroma_collection(self, allow_reset: bool):
+        collection_name = self.collection_name
         try:
             existing = [c.name for c in self.client.list_collections()]
             if collection_name in existing:
                 if allow_reset:
                     logger.warning(f"Resetting existing collection '{collection_name}'")
                     self.client.delete_collection(name=collection_name)
-                    self.collection = self.client.create_collection(name=collection_name)
+                    collection = self.client.create_collection(name=collection_name)
                 else:
-                    self.collection = self.client.get_collection(name=collection_name)
+                    collection = self.client.get_collection(name=collection_name)
             else:
-                self.collection = self.client.create_collection(name=collection_name)
+                collection = self.client.create_collection(name=collection_name)
             logger.info(f"Using Chroma collection: '{collection_name}'")
+            return collection
         except Exception:
             logger.exception("Failed to get/create Chroma collection")
             raise
 
     def _load_embedding_model(self):
         if self._embed_model is None:
-            logger.info(f"Loading embedding model: {self.embedding_model_name}")
-            try:
-                self._embed_model = SentenceTransformer(self.embedding_model_name)
-            except Exception:
-                logger.exception("Failed to load embedding model")
-                raise
+            self._embed_model = get_embedding_model(self.embedding_model_name, self.embedding_backend)
         return self._embed_model
 
+    def warmup(self) -> None:
+        """Loads the embedding model and runs one encode."""
+        self._load_embedding_model().encode(["warmup"])
+
+    def _bump_generation(self) -> None:
+        self.generation += 1
+        self.query_cache.clear()
+
     def embed_texts(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
-        model = self._load_embedding_model()
-        embeddings = []
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i : i + batch_size]
-            embs = model.encode(batch, convert_to_numpy=True, show_progress_bar=False)
-            embeddings.extend(embs.tolist())
-        return embeddings
+        """Embeds texts through the shared content-hash cache; only misses hit the model."""
+
+        def encode(missing: List[str]):
+            model = self._load_embedding_model()
+            EMBED_BATCH_SIZE.observe(len(missing))
+            with timed(EMBED_SECONDS, "embed"):
+                return model.encode(missing, batch_size=batch_size)
+
+        return self.embedding_cache.embed(self.embedding_cache_name, texts, encode)
 
     def add_documents(
         self,
@@ -84,19 +330,24 @@ class VectorStore:
             raise ValueError("ids, documents, metadatas must have same length")
 
         with self._lock:
-            for i in range(0, len(documents), batch_size):
-                b_ids = ids[i : i + batch_size]
-                b_docs = documents[i : i + batch_size]
-                b_meta = metadatas[i : i + batch_size]
-
-                embeddings = self.embed_texts(b_docs)
-                self.collection.add(
-                    ids=b_ids,
-                    documents=b_docs,
-                    metadatas=b_meta,
-                    embeddings=embeddings,
-                )
-                logger.info(f"Added batch of {len(b_docs)} docs to {self.collection_name}")
+            try:
+                for i in range(0, len(documents), batch_size):
+                    b_ids = ids[i : i + batch_size]
+                    b_docs = documents[i : i + batch_size]
+                    b_meta = metadatas[i : i + batch_size]
+
+                    embeddings = self.embed_texts(b_docs)
+                    with timed(VECTOR_DB_SECONDS, "vector_db", operation="add"):
+                        self.collection.add(
+                            ids=b_ids,
+                            documents=b_docs,
+                            metadatas=b_meta,
+                            embeddings=embeddings,
+                        )
+                    logger.info(f"Added batch of {len(b_docs)} docs to {self.collection_name}")
+            finally:
+                # earlier batches may have been written even if a later one failed
+                self._bump_generation()
 
     def upsert_documents(
         self,
@@ -111,71 +362,199 @@ class VectorStore:
             raise ValueError("ids, documents, metadatas must match")
 
         with self._lock:
-            for i in range(0, len(documents), batch_size):
-                b_ids = ids[i : i + batch_size]
-                b_docs = documents[i : i + batch_size]
-                b_meta = metadatas[i : i + batch_size]
+            try:
+                for i in range(0, len(documents), batch_size):
+                    b_ids = ids[i : i + batch_size]
+                    b_docs = documents[i : i + batch_size]
+                    b_meta = metadatas[i : i + batch_size]
 
-                embeddings = self.embed_texts(b_docs)
-                self.collection.upsert(
-                    ids=b_ids,
-                    documents=b_docs,
-                    metadatas=b_meta,
-                    embeddings=embeddings,
-                )
-                logger.info(f"Upserted batch of {len(b_docs)} docs")
+                    embeddings = self.embed_texts(b_docs)
+                    with timed(VECTOR_DB_SECONDS, "vector_db", operation="upsert"):
+                        self.collection.upsert(
+                            ids=b_ids,
+                            documents=b_docs,
+                            metadatas=b_meta,
+                            embeddings=embeddings,
+                        )
+                    logger.info(f"Upserted batch of {len(b_docs)} docs")
+            finally:
+                # earlier batches may have been written even if a later one failed
+                self._bump_generation()
 
     def query(
         self,
         query_text: str,
         top_k: int = 5,
         include: Optional[List[str]] = None,
+        use_cache: bool = True,
+        doc_ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
+        """
+        Nearest-chunk search. doc_ids restricts the search to those documents;
+        where is passed through as an extra Chroma metadata filter.
+        """
+        return self.query_many(
+            [query_text],
+            top_k=top_k,
+            include=include,
+            use_cache=use_cache,
+            doc_ids=doc_ids,
+            where=where,
+        )[0]
+
+    def query_many(
+        self,
+        query_texts: List[str],
+        top_k: int = 5,
+        include: Optional[List[str]] = None,
+        use_cache: bool = True,
+        doc_ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Batched query: all uncached questions are embedded in one model call
+        and searched in one Chroma query. Returns one result dict per question,
+        in the same shape as query().
+        """
         # Allowed include keys in chroma v0.5+
         allowed_includes = {"documents", "embeddings", "metadatas", "distances", "uris", "data"}
         if include is None:
             include = ["documents", "metadatas", "distances"]
         include = [i for i in include if i in allowed_includes]
 
-        query_embedding = self.embed_texts([query_text])[0]
+        where = build_where(doc_ids, where)
 
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=include,
-        )
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(query_texts)
+        use_cache = use_cache and self.query_cache.enabled
+        where_key = json.dumps(where, sort_keys=True) if where else None
+        generation = self.generation
+
+        def cache_key(text: str) -> tuple:
+            return (text, top_k, tuple(include), where_key, generation)
 
-        def _first_or_empty(field_name):
+        missing: List[int] = []
+        for i, text in enumerate(query_texts):
+            cached = self.query_cache.get(cache_key(text)) if use_cache else None
+            if cached is not None:
+                outputs[i] = cached
+            else:
+                missing.append(i)
+
+        if not missing:
+            return outputs
+
+        query_embeddings = self.embed_texts([query_texts[i] for i in missing])
+
+        with timed(VECTOR_DB_SECONDS, "vector_db", operation="query"):
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                include=include,
+                where=where,
+            )
+
+        def _nth_or_empty(field_name, n):
             val = results.get(field_name, [])
             if not val:
                 return []
             if isinstance(val, list) and len(val) > 0 and isinstance(val[0], list):
-                return val[0]
+                return val[n] if n < len(val) else []
             return val
 
-        documents = _first_or_empty("documents")
-        metadatas = _first_or_empty("metadatas")
-        distances = _first_or_empty("distances")
-        ids = _first_or_empty("ids")
+        for n, i in enumerate(missing):
+            output = {
+                "ids": _nth_or_empty("ids", n),
+                "documents": _nth_or_empty("documents", n),
+                "metadatas": _nth_or_empty("metadatas", n),
+                "distances": _nth_or_empty("distances", n),
+            }
+            if "embeddings" in include:
+                # Chroma hands these back as numpy arrays
+                embeddings = results.get("embeddings")
+                output["embeddings"] = (
+                    np.asarray(embeddings[n], dtype=np.float32).tolist()
+                    if embeddings is not None and n < len(embeddings) else []
+                )
+            if use_cache:
+                self.query_cache.put(cache_key(query_texts[i]), output)
+            outputs[i] = output
+        return outputs
 
+    def write_embeddings(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+    ) -> None:
+        """Upserts chunks whose embeddings were computed elsewhere (bulk ingestion)."""
+        if not (len(ids) == len(documents) == len(metadatas) == len(embeddings)):
+            raise ValueError("ids, documents, metadatas, embeddings must match")
+        with self._lock:
+            with timed(VECTOR_DB_SECONDS, "vector_db", operation="upsert"):
+                self.collection.upsert(
+                    ids=ids,
+                    documents=documents,
+                    metadatas=metadatas,
+                    embeddings=embeddings,
+                )
+            self._bump_generation()
+        logger.info(f"Wrote batch of {len(ids)} pre-embedded docs to {self.collection_name}")
+
+    def get_document_chunks(
+        self,
+        doc_id: str,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Returns ids (+ metadatas / documents) of every stored chunk of doc_id."""
+        if include is None:
+            include = ["metadatas"]
+        with timed(VECTOR_DB_SECONDS, "vector_db", operation="get"):
+            results = self.collection.get(where={"doc_id": doc_id}, include=include)
         return {
-            "ids": ids,
-            "documents": documents,
-            "metadatas": metadatas,
-            "distances": distances,
+            "ids": results.get("ids") or [],
+            "metadatas": results.get("metadatas") or [],
+            "documents": results.get("documents") or [],
         }
 
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Rewrites metadata of existing chunks without re-embedding them."""
+        if len(ids) != len(metadatas):
+            raise ValueError("ids, metadatas must match")
+        if not ids:
+            return
+        with self._lock:
+            with timed(VECTOR_DB_SECONDS, "vector_db", operation="update"):
+                self.collection.update(ids=ids, metadatas=metadatas)
+            self._bump_generation()
+        logger.info(f"Updated metadata of {len(ids)} docs")
+
     def delete_by_id(self, ids: List[str]) -> None:
-        self.collection.delete(ids=ids)
+        with self._lock:
+            with timed(VECTOR_DB_SECONDS, "vector_db", operation="delete"):
+                self.collection.delete(ids=ids)
+            self._bump_generation()
         logger.info(f"Deleted IDs: {ids}")
 
     def reset_collection(self) -> None:
-        self.client.delete_collection(name=self.collection_name)
-        self.collection = self.client.create_collection(name=self.collection_name)
+        if self.client is None:
+            self.collection.reset()
+        else:
+            self.client.delete_collection(name=self.collection_name)
+            self.collection = self.client.create_collection(name=self.collection_name)
+        self._bump_generation()
         logger.warning(f"Collection '{self.collection_name}' reset!")
 
     def get_collection_stats(self) -> Dict[str, Any]:
-        return {"count": self.collection.count()}
+        return {
+            "count": self.collection.count(),
+            "embedding_backend": self.embedding_backend,
+            "index_backend": self.index_backend,
+            "embedding_cache": self.embedding_cache.stats(),
+            "query_cache": self.query_cache.stats(),
+            "generation": self.generation,
+        }
 
     def add_single(self, id_: str, document: str, metadata: Optional[Dict[str, Any]] = None):
         self.add_documents([id_], [document], [metadata or {}])
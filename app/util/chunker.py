@@ -3,12 +3,82 @@ chunker.py
 Token-based and sentence-aware text chunking for legal document RAG systems.
 """
 
-import nltk
-from nltk.tokenize import sent_tokenize
-from typing import List
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 
-# Download NLTK tokenizer if not already present
-nltk.download("punkt", quiet=True)
+from app.util.instrumentation import CHUNK_SECONDS, CHUNKS_PER_DOCUMENT, timed
+
+logger = logging.getLogger(__name__)
+
+# Fetch the punkt sentence model on first use if it is missing; set to 0 on air-gapped hosts
+NLTK_AUTO_DOWNLOAD = os.getenv("NLTK_AUTO_DOWNLOAD", "1").lower() in ("1", "true", "yes")
+
+DEFAULT_TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+_tokenizers: Dict[str, object] = {}
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer(name: str = DEFAULT_TOKENIZER_NAME):
+    """Returns a shared HuggingFace tokenizer, loading it on first use."""
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _tokenizer_lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                _tokenizers[name] = tokenizer
+    return tokenizer
+
+
+_sentence_splitter: Optional[Callable[[str], List[str]]] = None
+_sentence_lock = threading.Lock()
+# Used when punkt is unavailable: split after . ! ? followed by an upper-case or digit start
+_FALLBACK_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def _regex_sent_tokenize(text: str) -> List[str]:
+    return [s for s in _FALLBACK_SENTENCE_END.split(text.strip()) if s]
+
+
+def _load_sentence_splitter() -> Callable[[str], List[str]]:
+    import nltk
+    from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+
+    try:
+        nltk_sent_tokenize("Probe. Sentence.")
+        return nltk_sent_tokenize
+    except LookupError:
+        pass
+    if NLTK_AUTO_DOWNLOAD:
+        # newer nltk reads punkt_tab, older releases punkt
+        for resource in ("punkt_tab", "punkt"):
+            nltk.download(resource, quiet=True)
+        try:
+            nltk_sent_tokenize("Probe. Sentence.")
+            return nltk_sent_tokenize
+        except LookupError:
+            pass
+    logger.warning("nltk punkt model unavailable; using regex sentence splitting")
+    return _regex_sent_tokenize
+
+
+def get_sentence_splitter() -> Callable[[str], List[str]]:
+    """Returns the sentence splitter, resolving nltk punkt (or the regex fallback) on first use."""
+    global _sentence_splitter
+    if _sentence_splitter is None:
+        with _sentence_lock:
+            if _sentence_splitter is None:
+                _sentence_splitter = _load_sentence_splitter()
+    return _sentence_splitter
+
+
+def sent_tokenize(text: str) -> List[str]:
+    return get_sentence_splitter()(text)
 
 
 def chunk_text_sentence_based(text: str, max_words: int = 200) -> List[str]:
@@ -97,6 +167,232 @@ def chunk_text_token_based(
     return chunks
 
 
+def _segments_text(sentences: List[str], offsets, segments: List[Tuple[int, int]]) -> str:
+    """Joins (sentence_index, first_token) segments back into chunk text."""
+    parts = []
+    for sent_idx, first_token in segments:
+        sentence = sentences[sent_idx]
+        if first_token > 0:
+            sentence = sentence[offsets[sent_idx][first_token][0]:]
+        parts.append(sentence)
+    return " ".join(parts).strip()
+
+
+def _overlap_segments(
+    segments: List[Tuple[int, int]],
+    counts: List[int],
+    overlap: int
+) -> List[Tuple[int, int]]:
+    """Returns the segments covering the last `overlap` tokens of a chunk."""
+    tail = []
+    need = overlap
+    for sent_idx, first_token in reversed(segments):
+        available = counts[sent_idx] - first_token
+        if available >= need:
+            tail.append((sent_idx, counts[sent_idx] - need))
+            break
+        tail.append((sent_idx, first_token))
+        need -= available
+    tail.reverse()
+    return tail
+
+
+def chunk_text_token_batched(
+    text: str,
+    tokenizer,
+    max_tokens: int = 256,
+    overlap: int = 20
+) -> List[str]:
+    """
+    Linear-time version of chunk_text_token_based.
+    All sentences are tokenized once in a single batched fast-tokenizer call;
+    chunk sizes are then tracked as running token counts and the overlap
+    window is cut from the original text using token character offsets
+    instead of re-encoding the chunk and decoding the overlap tokens.
+
+    Params:
+        text: full text to chunk
+        tokenizer: HuggingFace *fast* tokenizer instance (needs offset mapping)
+        max_tokens: maximum tokens per chunk
+        overlap: number of tokens to repeat (sliding window)
+
+    Returns:
+        List[str]: list of chunk strings
+    """
+
+    sentences = sent_tokenize(text)
+    if not sentences:
+        return []
+
+    encoded = tokenizer(
+        sentences,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+    )
+    offsets = encoded["offset_mapping"]
+    counts = [len(o) for o in offsets]
+
+    chunks = []
+    # Current chunk as (sentence_index, first_token) pairs; overlap windows
+    # start part-way into a sentence, everything else starts at token 0.
+    segments: List[Tuple[int, int]] = []
+    current_len = 0
+
+    for sent_idx, sentence_len in enumerate(counts):
+        # If adding this sentence exceeds limit → finalize current chunk
+        if segments and current_len + sentence_len > max_tokens:
+            chunks.append(_segments_text(sentences, offsets, segments))
+
+            # Build overlap
+            if overlap > 0 and current_len > overlap:
+                segments = _overlap_segments(segments, counts, overlap)
+                current_len = overlap
+            else:
+                segments = []
+                current_len = 0
+
+        segments.append((sent_idx, 0))
+        current_len += sentence_len
+
+    # Add last chunk
+    if segments:
+        last = _segments_text(sentences, offsets, segments)
+        if last:
+            chunks.append(last)
+
+    return chunks
+
+
+# Longest unterminated text carried between feed() calls before it is cut as a sentence
+MAX_CARRY_CHARS = 20000
+
+_WORD = re.compile(r"\S+")
+
+
+def _word_offsets(sentences: List[str]) -> List[List[Tuple[int, int]]]:
+    return [[m.span() for m in _WORD.finditer(s)] for s in sentences]
+
+
+class StreamingChunker:
+    """
+    Incremental chunk_text_token_batched over text that arrives in pieces
+    (e.g. pages). Text fed so far is split into sentences; the last sentence
+    may continue in the next piece, so it is carried over and re-split with
+    it. Complete sentences go through the same running-count/overlap logic,
+    so the overlap window carries across page boundaries. Only the sentences
+    of the current chunk and the carry are kept.
+
+    Each chunk comes out as {"text", "page_start", "page_end"}, the pages of
+    its first and last sentence. Without a fast tokenizer, words stand in
+    for tokens.
+    """
+
+    def __init__(self, tokenizer=None, max_tokens: int = 256, overlap: int = 20):
+        self.tokenizer = tokenizer if getattr(tokenizer, "is_fast", False) else None
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self._carry = ""
+        self._carry_page: Optional[int] = None
+        # sentences referenced by the current chunk: text, token offsets, token count, pages
+        self._sentences: List[str] = []
+        self._offsets: List[List[Tuple[int, int]]] = []
+        self._counts: List[int] = []
+        self._pages: List[Tuple[Optional[int], Optional[int]]] = []
+        self._segments: List[Tuple[int, int]] = []
+        self._current_len = 0
+        self.chunks_emitted = 0
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Dict[str, object]]:
+        """Adds a piece of text; returns the chunks it completed."""
+        if not text:
+            return []
+        carry_page = self._carry_page if self._carry else page
+        buffered = f"{self._carry} {text}" if self._carry else text
+        sentences = sent_tokenize(buffered)
+        if not sentences:
+            return []
+        self._carry = sentences.pop()
+        self._carry_page = page if sentences else carry_page
+        pages = [(page, page) for _ in sentences]
+        if pages:
+            pages[0] = (carry_page, page)
+        if len(self._carry) > MAX_CARRY_CHARS:
+            sentences.append(self._carry)
+            pages.append((self._carry_page, page))
+            self._carry = ""
+        return self._add_sentences(sentences, pages)
+
+    def finish(self) -> List[Dict[str, object]]:
+        """Flushes the carried sentence and the last chunk."""
+        out = []
+        if self._carry:
+            carry, self._carry = self._carry, ""
+            out = self._add_sentences([carry], [(self._carry_page, self._carry_page)])
+        if self._segments:
+            chunk = self._chunk()
+            if chunk["text"]:
+                out.append(chunk)
+            self._segments = []
+            self._current_len = 0
+        return out
+
+    def _encode(self, sentences: List[str]) -> List[List[Tuple[int, int]]]:
+        if self.tokenizer is None:
+            return _word_offsets(sentences)
+        return self.tokenizer(
+            sentences,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )["offset_mapping"]
+
+    def _chunk(self) -> Dict[str, object]:
+        self.chunks_emitted += 1
+        first, last = self._segments[0][0], self._segments[-1][0]
+        return {
+            "text": _segments_text(self._sentences, self._offsets, self._segments),
+            "page_start": self._pages[first][0],
+            "page_end": self._pages[last][1],
+        }
+
+    def _add_sentences(self, sentences: List[str], pages) -> List[Dict[str, object]]:
+        if not sentences:
+            return []
+        out = []
+        for sentence, offsets, sentence_pages in zip(sentences, self._encode(sentences), pages):
+            sentence_len = len(offsets)
+            if self._segments and self._current_len + sentence_len > self.max_tokens:
+                out.append(self._chunk())
+                if self.overlap > 0 and self._current_len > self.overlap:
+                    self._segments = _overlap_segments(self._segments, self._counts, self.overlap)
+                    self._current_len = self.overlap
+                else:
+                    self._segments = []
+                    self._current_len = 0
+                self._drop_unreferenced()
+
+            self._sentences.append(sentence)
+            self._offsets.append(offsets)
+            self._counts.append(sentence_len)
+            self._pages.append(sentence_pages)
+            self._segments.append((len(self._sentences) - 1, 0))
+            self._current_len += sentence_len
+        return out
+
+    def _drop_unreferenced(self) -> None:
+        keep_from = self._segments[0][0] if self._segments else len(self._sentences)
+        if keep_from == 0:
+            return
+        del self._sentences[:keep_from]
+        del self._offsets[:keep_from]
+        del self._counts[:keep_from]
+        del self._pages[:keep_from]
+        self._segments = [(i - keep_from, first) for i, first in self._segments]
+
+
 def smart_chunker(
     text: str,
     tokenizer=None,
@@ -106,7 +402,8 @@ def smart_chunker(
 ) -> List[str]:
     """
     Automatically selects BEST chunking strategy.
-    If tokenizer is provided → use token-based.
+    If a fast tokenizer is provided → use batched token-based.
+    If a slow tokenizer is provided → use token-based.
     Else → fallback to sentence-based.
 
     Params:
@@ -117,13 +414,23 @@ def smart_chunker(
         fallback_max_words: word limit for sentence-based chunking
     """
 
-    if tokenizer:
-        return chunk_text_token_based(
-            text,
-            tokenizer=tokenizer,
-            max_tokens=max_tokens,
-            overlap=overlap
-        )
-
-    return chunk_text_sentence_based(text, max_words=fallback_max_words)
+    with timed(CHUNK_SECONDS, "chunk"):
+        if tokenizer and getattr(tokenizer, "is_fast", False):
+            chunks = chunk_text_token_batched(
+                text,
+                tokenizer=tokenizer,
+                max_tokens=max_tokens,
+                overlap=overlap
+            )
+        elif tokenizer:
+            chunks = chunk_text_token_based(
+                text,
+                tokenizer=tokenizer,
+                max_tokens=max_tokens,
+                overlap=overlap
+            )
+        else:
+            chunks = chunk_text_sentence_based(text, max_words=fallback_max_words)
 
+    CHUNKS_PER_DOCUMENT.observe(len(chunks))
+    return chunks
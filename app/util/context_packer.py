@@ -0,0 +1,190 @@
+"""
+context_packer.py
+Turns retrieved chunks into the clause list of a RAG prompt.
+
+1. near-duplicates are dropped and the rest ordered by MMR over the
+   retrieval embeddings (relevance vs. similarity to already-picked chunks)
+2. picked chunks that are neighbours in the same document (chunk_index,
+   chunk_index + 1) are merged, cutting the text the chunker repeated as overlap
+3. passages are added in MMR order until the token budget is spent, with
+   tokens counted by the chunking tokenizer
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# cosine similarity above which a chunk counts as a duplicate of a picked one
+CONTEXT_DUP_THRESHOLD = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.95"))
+# longest overlap searched for between neighbouring chunks (characters)
+MAX_OVERLAP_CHARS = 2000
+# tokens spent per passage on the "[CLAUSE n]" header and separators
+PASSAGE_OVERHEAD_TOKENS = 8
+
+
+def mmr_order(
+    embeddings: np.ndarray,
+    relevance: np.ndarray,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    dup_threshold: float = CONTEXT_DUP_THRESHOLD,
+) -> List[int]:
+    """
+    Greedy maximal-marginal-relevance order of the rows of embeddings.
+    Rows whose cosine similarity to an already picked row exceeds
+    dup_threshold are left out.
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    order: List[int] = []
+    while available.any():
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        max_sim = np.maximum(max_sim, similarity[pick])
+        available &= max_sim <= dup_threshold
+    return order
+
+
+def strip_overlap(previous: str, following: str, max_chars: int = MAX_OVERLAP_CHARS) -> str:
+    """Returns following without its longest prefix that is also a suffix of previous."""
+    limit = min(len(previous), len(following), max_chars)
+    if limit == 0:
+        return following
+    # overlaps start on a token boundary, so anchor the search on the first word
+    first_space = following.find(" ")
+    head = following[: min(first_space if first_space > 0 else limit, limit)]
+    start = len(previous) - limit
+    while True:
+        pos = previous.find(head, start)
+        if pos == -1:
+            return following
+        size = len(previous) - pos
+        if following.startswith(previous[pos:]):
+            return following[size:].lstrip()
+        start = pos + 1
+
+
+def merge_neighbours(chunks: Sequence[str], metadatas: Sequence[Dict[str, Any]], order: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Groups the picked chunks into passages of consecutive chunk_index values
+    per doc_id. Passages keep the MMR position of their best member.
+    """
+    position = {i: p for p, i in enumerate(order)}
+    by_doc: Dict[Any, List[int]] = {}
+    passages = []
+    for i in order:
+        meta = metadatas[i] or {}
+        if meta.get("doc_id") is None or meta.get("chunk_index") is None:
+            passages.append(_passage(chunks, metadatas, [i], position))
+        else:
+            by_doc.setdefault(meta["doc_id"], []).append(i)
+
+    for members in by_doc.values():
+        members.sort(key=lambda i: metadatas[i]["chunk_index"])
+        run = [members[0]]
+        for i in members[1:]:
+            if metadatas[i]["chunk_index"] == metadatas[run[-1]]["chunk_index"] + 1:
+                run.append(i)
+            else:
+                passages.append(_passage(chunks, metadatas, run, position))
+                run = [i]
+        passages.append(_passage(chunks, metadatas, run, position))
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def _passage(chunks, metadatas, run: List[int], position: Dict[int, int]) -> Dict[str, Any]:
+    text = chunks[run[0]]
+    for prev, nxt in zip(run, run[1:]):
+        text = f"{text} {strip_overlap(chunks[prev], chunks[nxt])}".strip()
+    meta = metadatas[run[0]] or {}
+    return {
+        "text": text,
+        "doc_id": meta.get("doc_id"),
+        "chunk_indexes": [(metadatas[i] or {}).get("chunk_index") for i in run],
+        "sources": run,
+        "rank": min(position[i] for i in run),
+    }
+
+
+def _count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    if tokenizer is None:
+        return [len(t.split()) for t in texts]
+    encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    return [len(ids) for ids in encoded]
+
+
+def _truncate(tokenizer, text: str, max_tokens: int) -> str:
+    if tokenizer is None or not getattr(tokenizer, "is_fast", False):
+        return " ".join(text.split()[:max_tokens])
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return text
+    return text[: offsets[max_tokens - 1][1]]
+
+
+def pack_context(
+    chunks: Sequence[str],
+    metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+    embeddings: Optional[Sequence[Sequence[float]]] = None,
+    distances: Optional[Sequence[float]] = None,
+    tokenizer=None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Dict[str, Any]:
+    """
+    Packs retrieved chunks (in retrieval order) into prompt passages.
+    Returns {"passages": [...], "tokens": int, "dropped": [chunk positions]}.
+    """
+    n = len(chunks)
+    if n == 0:
+        return {"passages": [], "tokens": 0, "dropped": []}
+    metadatas = list(metadatas or [{} for _ in range(n)])
+
+    if embeddings is not None and len(embeddings) == n:
+        if distances is not None and len(distances) == n:
+            # squared L2 between unit vectors -> cosine similarity
+            relevance = 1.0 - np.asarray(distances, dtype=np.float32) / 2.0
+        else:
+            relevance = np.linspace(1.0, 0.0, n, dtype=np.float32)
+        order = mmr_order(np.asarray(embeddings, dtype=np.float32), relevance)
+    else:
+        order = list(range(n))
+
+    passages = merge_neighbours(chunks, metadatas, order)
+    counts = _count_tokens(tokenizer, [p["text"] for p in passages])
+
+    packed, used = [], 0
+    for passage, count in zip(passages, counts):
+        cost = count + PASSAGE_OVERHEAD_TOKENS
+        if used + cost <= token_budget:
+            packed.append(passage)
+            used += cost
+        elif not packed and token_budget > PASSAGE_OVERHEAD_TOKENS:
+            # the best passage alone is too long: keep its head rather than nothing
+            keep = token_budget - PASSAGE_OVERHEAD_TOKENS
+            passage["text"] = _truncate(tokenizer, passage["text"], keep)
+            packed.append(passage)
+            used = token_budget
+
+    kept = {i for p in packed for i in p["sources"]}
+    for passage in packed:
+        del passage["rank"]
+    return {
+        "passages": packed,
+        "tokens": used,
+        "dropped": [i for i in range(n) if i not in kept],
+    }
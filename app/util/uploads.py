@@ -0,0 +1,115 @@
+"""
+app/util/uploads.py
+Bounded upload handling.
+
+MaxBodySizeMiddleware rejects request bodies larger than MAX_UPLOAD_BYTES
+with 413, up front when Content-Length says so and otherwise as soon as the
+streamed body crosses the limit, so the multipart parser never spools more
+than that. spool_to_disk copies an upload into a named temp file in fixed-size
+chunks, giving process-pool extractors a path to open instead of the bytes.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
+# 0 disables the limit
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Where uploads are spooled for extraction; None uses the system temp dir
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+
+class BodyTooLargeError(Exception):
+    pass
+
+
+class MaxBodySizeMiddleware:
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise BodyTooLargeError(f"Request body exceeds {self.max_bytes} bytes")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # the app may turn the aborted body read into its own error response
+            if exceeded and not response_started:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(send)
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": f"Upload exceeds the {self.max_bytes} byte limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def spool_to_disk(source: BinaryIO, filename: Optional[str] = None, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Copies source into a named temp file (keeping filename's extension) and
+    returns its path. Raises BodyTooLargeError past max_bytes. The caller
+    deletes the file.
+    """
+    suffix = os.path.splitext(filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=UPLOAD_TMP_DIR)
+    try:
+        source.seek(0)
+        with os.fdopen(fd, "wb") as out:
+            if max_bytes > 0:
+                copied = 0
+                while True:
+                    chunk = source.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    copied += len(chunk)
+                    if copied > max_bytes:
+                        raise BodyTooLargeError(f"Upload exceeds {max_bytes} bytes")
+                    out.write(chunk)
+            else:
+                shutil.copyfileobj(source, out, UPLOAD_CHUNK_BYTES)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
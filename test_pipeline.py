@@ -1,8 +1,298 @@
+import os
+import subprocess
+import sys
 import requests
 import json
 
 BASE_URL = "http://127.0.0.1:8000/api"
 
+# Importing the app must stay cheap: no model loads, no network
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "5.0"))
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "chromadb")
+
+
+# -----------------------------------------
+# 0. Import-time budget (no server needed)
+# -----------------------------------------
+def test_import_time():
+    print("\n--- IMPORT-TIME BUDGET ---\n")
+
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app.main\n"
+        "print(json.dumps({'seconds': time.perf_counter() - start,"
+        f" 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "STARTUP_WARMUP": "0", "NLTK_AUTO_DOWNLOAD": "0"},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    print("Import time: %.2fs (budget %.1fs)" % (report["seconds"], IMPORT_TIME_BUDGET))
+    assert not report["heavy"], f"Heavy modules imported at startup: {report['heavy']}"
+    assert report["seconds"] < IMPORT_TIME_BUDGET
+
+
+# -----------------------------------------
+# 0b. Numpy index: duplicate ids in delete (no server needed)
+# -----------------------------------------
+def test_numpy_delete_duplicate_ids():
+    print("\n--- NUMPY INDEX DELETE ---\n")
+
+    from app.services.numpy_index import NumpyCollection
+
+    collection = NumpyCollection("delete_duplicates")
+    collection.add(
+        ids=["id4", "id5", "id6"],
+        documents=["four", "five", "six"],
+        metadatas=[{"doc_id": "d"}] * 3,
+        embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+    )
+
+    # The same id twice must free one row, not hand it out twice
+    collection.delete(ids=["id5", "id5"])
+    collection.add(
+        ids=["a", "b"],
+        documents=["alpha", "beta"],
+        metadatas=[{"doc_id": "d"}] * 2,
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+    )
+
+    stored = collection.get(ids=["id4", "id6", "a", "b"])
+    print("Stored ids:", stored["ids"])
+    assert sorted(stored["ids"]) == ["a", "b", "id4", "id6"]
+    assert collection.count() == 4
+
+
+# -----------------------------------------
+# 0c. Ingest rollback on a mid-stream failure (no server needed)
+# -----------------------------------------
+def test_ingest_rollback():
+    print("\n--- INGEST ROLLBACK ---\n")
+
+    import re
+    from app.services import ingest_document as ingest
+
+    class WordTokenizer:
+        is_fast = True
+
+        def __call__(self, texts, **kwargs):
+            return {"offset_mapping": [[m.span() for m in re.finditer(r"\S+", t)] for t in texts]}
+
+    class MemoryStore:
+        def __init__(self):
+            self.rows = {}
+
+        def get_document_chunks(self, doc_id, include=None):
+            ids = [i for i, (_, meta) in self.rows.items() if meta["doc_id"] == doc_id]
+            return {
+                "ids": ids,
+                "documents": [self.rows[i][0] for i in ids],
+                "metadatas": [self.rows[i][1] for i in ids],
+            }
+
+        def upsert_documents(self, ids, documents, metadatas, batch_size=50):
+            for id_, doc, meta in zip(ids, documents, metadatas):
+                self.rows[id_] = (doc, dict(meta))
+
+        def update_metadatas(self, ids, metadatas):
+            for id_, meta in zip(ids, metadatas):
+                self.rows[id_] = (self.rows[id_][0], dict(meta))
+
+        def delete_by_id(self, ids):
+            for id_ in ids:
+                self.rows.pop(id_, None)
+
+    class Registry:
+        def upsert(self, doc_id, chunk_count):
+            pass
+
+    def page(n):
+        return n, " ".join(f"Clause {n}.{k} binds the parties to these terms." for k in range(40))
+
+    def failing_pages():
+        yield page(0)  # new first page shifts every stored chunk
+        yield from (page(n) for n in range(1, 4))
+        raise IOError("extraction failed mid-stream")
+
+    store = MemoryStore()
+    originals = (ingest.get_vector_store, ingest.get_tokenizer, ingest.get_doc_registry)
+    ingest.get_vector_store = lambda: store
+    ingest.get_tokenizer = lambda name: WordTokenizer()
+    ingest.get_doc_registry = lambda: Registry()
+    try:
+        result = ingest.ingest_pages([page(n) for n in range(1, 6)], doc_id="contract", batch_size=4)
+        assert result["status"] == "success"
+        before = dict(store.rows)
+
+        try:
+            ingest.ingest_pages(failing_pages(), doc_id="contract", batch_size=4)
+            raise AssertionError("ingest_pages swallowed the stream failure")
+        except IOError:
+            pass
+    finally:
+        ingest.get_vector_store, ingest.get_tokenizer, ingest.get_doc_registry = originals
+
+    print("Chunks before: %d, after failed re-ingest: %d" % (len(before), len(store.rows)))
+    assert store.rows == before
+
+
+# -----------------------------------------
+# 0d. Large PDFs fan out to the PDF pool (no server needed)
+# -----------------------------------------
+def _minimal_pdf(page_texts):
+    """A valid PDF with one line of text per page, built by hand."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+def test_large_pdf_fanout():
+    print("\n--- LARGE PDF FAN-OUT ---\n")
+
+    import asyncio
+    import tempfile
+    from app.routers import upload
+    from app.services import extract_text
+    from app.services.stage_executor import get_stage
+
+    page_count = max(extract_text.PDF_PARALLEL_MIN_PAGES, 2 * extract_text.PDF_PAGES_PER_TASK)
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(_minimal_pdf([f"Page {n} of the court record" for n in range(1, page_count + 1)]))
+
+    submitted = []
+    get_pool, workers = extract_text._get_pdf_pool, extract_text.PDF_WORKERS
+
+    class CountingPool:
+        def __init__(self, pool):
+            self._pool = pool
+
+        def submit(self, fn, *args):
+            submitted.append(args[1:])
+            return self._pool.submit(fn, *args)
+
+    extract_text._get_pdf_pool = lambda: CountingPool(get_pool())
+    # fan out even on a single-core host
+    extract_text.PDF_WORKERS = max(2, workers)
+    try:
+        text = asyncio.run(
+            upload.run_extraction(get_stage("extract"), extract_text.extract_text_from_path, path, "record.pdf")
+        )
+    finally:
+        extract_text._get_pdf_pool, extract_text.PDF_WORKERS = get_pool, workers
+        extract_text.shutdown_pdf_pool()
+        os.unlink(path)
+
+    expected = -(-page_count // extract_text.PDF_PAGES_PER_TASK)
+    print("Pages: %d, page ranges sent to the PDF pool: %d" % (page_count, len(submitted)))
+    assert len(submitted) == expected
+    assert text.splitlines()[0] == "Page 1 of the court record"
+    assert text.splitlines()[-1] == f"Page {page_count} of the court record"
+
+
+# -----------------------------------------
+# 0e. LLM client against a mock Ollama (no server needed)
+# -----------------------------------------
+def test_llm_client_offline():
+    print("\n--- LLM CLIENT ---\n")
+
+    import asyncio
+    import httpx
+    from app.services.llm_client import LLMTimeoutError, LLMUnavailableError, OllamaClient
+
+    requests_seen = []
+
+    def client_for(handler):
+        async def counting(request):
+            requests_seen.append(json.loads(request.content))
+            return await handler(request)
+
+        return OllamaClient(
+            base_url="http://ollama.test", max_retries=2, retry_backoff=0, transport=httpx.MockTransport(counting)
+        )
+
+    async def server_error(request):
+        return httpx.Response(503, text="overloaded")
+
+    async def timeout(request):
+        raise httpx.ReadTimeout("no answer", request=request)
+
+    async def slow_answer(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"response": "Payment is due in 15 days.", "done": True})
+
+    class DropAfterFirstToken(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"response": "Payment", "done": false}\n'
+            raise httpx.ReadError("connection reset")
+
+    async def broken_stream(request):
+        return httpx.Response(200, stream=DropAfterFirstToken())
+
+    async def expect(error_type, coro):
+        try:
+            await coro
+        except error_type:
+            return
+        raise AssertionError(f"expected {error_type.__name__}")
+
+    async def run():
+        # 5xx: first attempt plus max_retries, then a typed error
+        requests_seen.clear()
+        await expect(LLMUnavailableError, client_for(server_error).generate("terms?"))
+        assert len(requests_seen) == 3, requests_seen
+
+        await expect(LLMTimeoutError, client_for(timeout).generate("terms?"))
+
+        # identical concurrent prompts share one request
+        requests_seen.clear()
+        client = client_for(slow_answer)
+        answers = await asyncio.gather(*[client.generate("payment terms?") for _ in range(5)])
+        assert set(answers) == {"Payment is due in 15 days."}
+        assert len(requests_seen) == 1, requests_seen
+
+        # a stream that already produced a token is not retried
+        requests_seen.clear()
+        tokens = []
+        try:
+            async for token in client_for(broken_stream).stream("payment terms?"):
+                tokens.append(token)
+            raise AssertionError("expected LLMUnavailableError")
+        except LLMUnavailableError:
+            pass
+        assert tokens == ["Payment"]
+        assert len(requests_seen) == 1, requests_seen
+
+    asyncio.run(run())
+    print("Retries, timeouts, coalescing and streaming behave as expected")
+
 
 # -----------------------------------------
 # 1. Upload a dummy legal document
@@ -59,6 +349,11 @@ def test_query():
 # MAIN
 # -----------------------------------------
 if __name__ == "__main__":
+    test_import_time()
+    test_numpy_delete_duplicate_ids()
+    test_ingest_rollback()
+    test_large_pdf_fanout()
+    test_llm_client_offline()
     uploaded = test_upload()
     test_query()
 